@@ -0,0 +1,298 @@
+"""Benchmark the volatility pipeline stage by stage and flag regressions against a stored baseline.
+
+Each stage runs in a fresh worker process, so its peak RSS is not inflated by earlier stages.
+Inputs of the later stages (RV/IV tables) are passed from the earlier ones. The stages are the
+ones volatility_analysis.py runs: close-close and GKYZ RV, the range-based estimators, the IV
+term structure, the fused relative difference screen and the visualizer.
+
+    python benchmark.py                                 # bundled daily-bars/ and options-data/
+    python benchmark.py --synthetic 1000 5000 20000     # also synthetic universes of these sizes
+    python benchmark.py --update-baseline               # store the results as the new baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+STAGES = ['close_close', 'gkyz', 'estimators', 'implied_vol', 'screen', 'visualizer']
+
+# Absolute floors below which a difference from the baseline is treated as noise
+MIN_SLOWDOWN_SECONDS = 0.05
+MIN_RSS_GROWTH_MB = 20
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Synthetic universe shape
+SYNTHETIC_END_DATE = '2024-10-17'
+SYNTHETIC_BARS = 1500
+SYNTHETIC_TRADE_DATES = 5
+SYNTHETIC_EXPIRIES = 12
+SYNTHETIC_STRIKES = 8
+
+
+def _peak_rss_mb():
+    """Return the peak resident set size of the current process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def make_synthetic_universe(base_folder, n_tickers, seed=0):
+    """Write a synthetic universe (tickers file, daily bars, options quotes) and return its IV date."""
+    rng = np.random.default_rng(seed)
+    daily_folder_path = os.path.join(base_folder, 'daily-bars')
+    options_data_folder_path = os.path.join(base_folder, 'options-data')
+    os.makedirs(daily_folder_path, exist_ok=True)
+    os.makedirs(options_data_folder_path, exist_ok=True)
+
+    tickers = [f"T{i:05d}" for i in range(n_tickers)]
+    pd.DataFrame({'Symbol': tickers}).to_csv(os.path.join(base_folder, 'options-tickers.csv'), index=False)
+
+    dates = pd.bdate_range(end=SYNTHETIC_END_DATE, periods=SYNTHETIC_BARS)
+    trade_dates = dates[-SYNTHETIC_TRADE_DATES:]
+    expiries = pd.date_range(SYNTHETIC_END_DATE, periods=SYNTHETIC_EXPIRIES, freq='W-FRI').strftime('%Y%m%d')
+    n_quotes = SYNTHETIC_TRADE_DATES * SYNTHETIC_EXPIRIES * SYNTHETIC_STRIKES
+    quote_times = (trade_dates + pd.Timedelta(hours=10)).tz_localize('America/New_York')
+
+    for ticker in tickers:
+        # Geometric random walk for the closes, with opens and ranges around them
+        vol = rng.uniform(0.15, 0.6)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, vol / np.sqrt(252), SYNTHETIC_BARS)))
+        open_ = close * np.exp(rng.normal(0, vol / np.sqrt(252) / 2, SYNTHETIC_BARS))
+        high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, vol / np.sqrt(252) / 2, SYNTHETIC_BARS)))
+        low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, vol / np.sqrt(252) / 2, SYNTHETIC_BARS)))
+        pd.DataFrame(
+            {'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Symbol': ticker}, index=dates
+        ).to_parquet(os.path.join(daily_folder_path, f"{ticker}.parquet"))
+
+        iv = vol * rng.uniform(0.7, 1.5, (4, n_quotes))
+        pd.DataFrame({
+            'time': np.repeat(quote_times, SYNTHETIC_EXPIRIES * SYNTHETIC_STRIKES),
+            'lastTradeDateOrContractMonth': np.tile(np.repeat(expiries, SYNTHETIC_STRIKES), SYNTHETIC_TRADE_DATES),
+            'lastGreeks_iv': iv[0],
+            'bidGreeks_iv': iv[1],
+            'askGreeks_iv': iv[2],
+            'modelGreeks_iv': iv[3],
+        }).to_parquet(os.path.join(options_data_folder_path, f"{ticker}.parquet"), index=False)
+
+    return trade_dates[-1].date()
+
+
+def latest_iv_date(base_folder):
+    """Return the last trade date in the options file of the first ticker."""
+    from data_handler import DataHandler
+
+    data_handler = DataHandler(base_folder)
+    for ticker in data_handler.load_tickers():
+        file_path = os.path.join(base_folder, 'options-data', f"{ticker}.parquet")
+        if os.path.exists(file_path):
+            times = pd.read_parquet(file_path, columns=['time'])['time']
+            return times.max().date()
+    raise FileNotFoundError(f"No options data found under {base_folder}")
+
+
+def _run_stage(stage, base_folder, iv_date, inputs, queue):
+    """Run one stage in a worker process and report its timing, peak RSS, row count and output."""
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    from data_handler import DataHandler
+    from visualizer import Visualizer
+    from volatility_calculator import VolatilityCalculator
+
+    try:
+        data_handler = DataHandler(base_folder)
+        tickers = data_handler.load_tickers()
+        vol_calculator = VolatilityCalculator(data_handler, Visualizer())
+        daily_folder_path = os.path.join(base_folder, 'daily-bars')
+        options_data_folder_path = os.path.join(base_folder, 'options-data')
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if stage == 'close_close':
+                output = vol_calculator.process_close_close_vol(tickers, daily_folder_path)
+            elif stage == 'gkyz':
+                output = vol_calculator.process_gkyz_vol(tickers, daily_folder_path)
+            elif stage == 'estimators':
+                output = vol_calculator.process_estimator_vols(tickers, daily_folder_path)
+            elif stage == 'implied_vol':
+                output = vol_calculator.process_implied_vol_term_structure(tickers, options_data_folder_path, iv_date)
+            elif stage == 'screen':
+                output = vol_calculator.screen_relative_differences(
+                    inputs['gkyz'], inputs['close_close'], inputs['implied_vol']
+                )
+            elif stage == 'visualizer':
+                vol_calculator.visualizer.visualize_top_relative_differences(inputs['combined'])
+                output = None
+            else:
+                raise ValueError(f"Unknown stage {stage}")
+        wall_time = time.perf_counter() - start
+        peak_rss_mb = _peak_rss_mb()
+
+        # Rows processed, as recorded by the calculator's stage metrics (the visualizer records none)
+        if stage == 'visualizer':
+            rows = inputs['combined'].size
+        else:
+            rows = sum(stage_metrics.rows for stage_metrics in vol_calculator.metrics.stages.values())
+
+        queue.put({'wall_time': wall_time, 'peak_rss_mb': peak_rss_mb, 'rows': rows, 'output': output})
+    except Exception as e:
+        queue.put({'error': f"{type(e).__name__}: {e}"})
+
+
+def run_stage(stage, base_folder, iv_date, inputs=None):
+    """Run a stage in a fresh process and return its metrics and output."""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_stage, args=(stage, base_folder, iv_date, inputs or {}, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def benchmark_universe(base_folder, iv_date, stages=None, repeats=1):
+    """Benchmark every stage on one universe, keeping the fastest of repeats runs, and return {stage: metrics}."""
+    stages = stages or STAGES
+    metrics = {}
+    outputs = {}
+    for stage in STAGES:
+        if stage not in stages and not _needed_by(stage, stages):
+            continue
+        inputs = dict(outputs)
+        # Best of several runs, so one slow run (e.g. a cold page cache) does not count as a regression
+        runs = [run_stage(stage, base_folder, iv_date, inputs) for _ in range(repeats if stage in stages else 1)]
+        failed = [run for run in runs if 'error' in run]
+        if failed:
+            print(f"  {stage}: failed - {failed[0]['error']}")
+            metrics[stage] = {'error': failed[0]['error']}
+            break
+        result = min(runs, key=lambda run: run['wall_time'])
+        result['peak_rss_mb'] = min(run['peak_rss_mb'] for run in runs)
+        result['repeats'] = len(runs)
+
+        output = result.pop('output')
+        for run in runs:
+            run.pop('output', None)
+        if stage == 'screen':
+            outputs['combined'] = output.combined
+        elif output is not None:
+            outputs[stage] = output
+
+        if stage in stages:
+            result['rows_per_second'] = result['rows'] / result['wall_time'] if result['wall_time'] > 0 else float('inf')
+            metrics[stage] = result
+            print(f"  {stage:<22} {result['wall_time']:8.3f}s  {result['peak_rss_mb']:8.1f} MB  "
+                  f"{result['rows_per_second']:12,.0f} rows/s")
+    return metrics
+
+
+def _needed_by(stage, stages):
+    """Check whether a stage produces inputs for one of the selected stages."""
+    needs = {
+        'screen': {'close_close', 'gkyz', 'implied_vol'},
+        'visualizer': {'close_close', 'gkyz', 'implied_vol', 'screen'},
+    }
+    return any(stage in needs.get(selected, ()) for selected in stages)
+
+
+def check_regressions(results, baseline, tolerance, min_slowdown=MIN_SLOWDOWN_SECONDS,
+                      rss_tolerance=None, min_rss_growth=MIN_RSS_GROWTH_MB):
+    """Return the stages whose wall time or peak RSS exceeds the baseline.
+
+    A stage regresses when it is worse than the baseline by more than the relative tolerance and
+    by more than the absolute floor (min_slowdown seconds, min_rss_growth MB), so that
+    millisecond-scale stages are not flagged for timer noise. rss_tolerance defaults to tolerance.
+    """
+    rss_tolerance = tolerance if rss_tolerance is None else rss_tolerance
+    checks = [('wall_time', 's', tolerance, min_slowdown), ('peak_rss_mb', ' MB', rss_tolerance, min_rss_growth)]
+    regressions = []
+    for universe, stages in results.items():
+        for stage, metrics in stages.items():
+            reference = baseline.get(universe, {}).get(stage)
+            if reference is None:
+                continue
+            for key, unit, relative, floor in checks:
+                if key not in metrics or key not in reference:
+                    continue
+                limit = max(reference[key] * (1 + relative), reference[key] + floor)
+                if metrics[key] > limit:
+                    regressions.append(f"{universe}/{stage} {key}: {metrics[key]:.3f}{unit} > {limit:.3f}{unit} "
+                                       f"(baseline {reference[key]:.3f}{unit} + max({relative:.0%}, {floor}{unit}))")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--synthetic', type=int, nargs='*', default=[], metavar='N',
+                        help="also benchmark synthetic universes of N tickers (e.g. 1000 5000 20000)")
+    parser.add_argument('--skip-bundled', action='store_true', help="do not benchmark the bundled data")
+    parser.add_argument('--stages', nargs='*', choices=STAGES, default=STAGES)
+    parser.add_argument('--iv-date', help="IV date for the bundled data (default: latest options trade date)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown over the baseline")
+    parser.add_argument('--min-slowdown', type=float, default=MIN_SLOWDOWN_SECONDS,
+                        help="slowdowns of at most this many seconds are never regressions")
+    parser.add_argument('--rss-tolerance', type=float, help="allowed peak RSS growth (default: --tolerance)")
+    parser.add_argument('--min-rss-growth', type=float, default=MIN_RSS_GROWTH_MB,
+                        help="peak RSS growth of at most this many MB is never a regression")
+    parser.add_argument('--repeats', type=int, default=3, help="runs per stage; the fastest is kept")
+    parser.add_argument('--output', help="write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if not args.skip_bundled:
+        base_folder = os.path.dirname(os.path.abspath(__file__))
+        iv_date = args.iv_date or latest_iv_date(base_folder)
+        print(f"bundled ({iv_date}):")
+        results['bundled'] = benchmark_universe(base_folder, iv_date, args.stages, args.repeats)
+
+    for n_tickers in args.synthetic:
+        base_folder = tempfile.mkdtemp(prefix=f"vol-bench-{n_tickers}-")
+        try:
+            print(f"synthetic-{n_tickers}: generating...")
+            iv_date = make_synthetic_universe(base_folder, n_tickers)
+            results[f"synthetic-{n_tickers}"] = benchmark_universe(base_folder, iv_date, args.stages, args.repeats)
+        finally:
+            shutil.rmtree(base_folder, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to store one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    failures = [f"{universe}/{stage}: {metrics['error']}"
+                for universe, stages in results.items() for stage, metrics in stages.items() if 'error' in metrics]
+    regressions = check_regressions(results, baseline, args.tolerance, args.min_slowdown, args.rss_tolerance,
+                                    args.min_rss_growth)
+    for line in failures + regressions:
+        print(f"REGRESSION {line}")
+    return 1 if failures or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,118 @@
 import os
+import json
+import logging
+import threading
+from collections import OrderedDict
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from file_utils import atomic_write, file_fingerprint
+from volatility_engine import Bars, VolatilityEngine
+
+# Columns needed by the realized volatility estimators
+BAR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Symbol']
+
+# Columns needed by the implied volatility loader
+IV_COLUMNS = ['time', 'lastTradeDateOrContractMonth', 'lastGreeks_iv', 'bidGreeks_iv', 'askGreeks_iv', 'modelGreeks_iv']
+
+# Directory prefix of the trade date partitions in a rewritten options store
+TRADE_DATE_PARTITION = 'trade_date='
+
+# Schema metadata key holding the ticker -> (row range, dates, source file size and mtime) index of a consolidated bar store
+BAR_STORE_INDEX_KEY = b'ticker_index'
+
+logger = logging.getLogger(__name__)
 
 class DataHandler:
-    def __init__(self, base_folder=None):
+    def __init__(self, base_folder=None, bar_cache_size=1024, bar_store_path=None):
         self.base_folder = base_folder if base_folder else os.getcwd()
 
+        # Consolidated bar store built by build_bar_store, memory-mapped on first use
+        self.bar_store_path = bar_store_path
+        self._bar_store = None
+        self._bar_store_lock = threading.Lock()
+        self.stale_bar_store_tickers = set()
+
+        # In-memory LRU store of daily bars, shared by every estimator in a run
+        self.bar_cache_size = bar_cache_size
+        self._bar_cache = OrderedDict()
+        self._bar_cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Rows and bytes read, for the whole run and per reader thread
+        self.rows_read = 0
+        self.bytes_read = 0
+        self._io_lock = threading.Lock()
+        self._thread_io = threading.local()
+
+    def _record_read(self, rows, n_bytes):
+        """Count rows loaded and bytes read from disk by the current thread (cache hits read no bytes)."""
+        with self._io_lock:
+            self.rows_read += rows
+            self.bytes_read += n_bytes
+        self._thread_io.rows = getattr(self._thread_io, 'rows', 0) + rows
+        self._thread_io.bytes = getattr(self._thread_io, 'bytes', 0) + n_bytes
+
+    def reset_thread_io(self):
+        """Reset the rows/bytes counters of the current thread."""
+        self._thread_io.rows = 0
+        self._thread_io.bytes = 0
+
+    def thread_io(self):
+        """Return the (rows, bytes) read by the current thread since its last reset."""
+        return getattr(self._thread_io, 'rows', 0), getattr(self._thread_io, 'bytes', 0)
+
+    @staticmethod
+    def _column_bytes(parquet_file, columns, filters=None):
+        """Return the on-disk size of the given columns in the row groups of a parquet file that a read would scan.
+
+        With time filters, row groups whose time statistics fall outside the range are skipped by
+        pyarrow and not counted.
+        """
+        metadata = parquet_file.metadata
+        wanted = set(columns)
+        total = 0
+        for row_group in range(metadata.num_row_groups):
+            row_group_metadata = metadata.row_group(row_group)
+            if filters and not DataHandler._row_group_in_range(row_group_metadata, filters):
+                continue
+            for column in range(row_group_metadata.num_columns):
+                chunk = row_group_metadata.column(column)
+                if chunk.path_in_schema in wanted:
+                    total += chunk.total_compressed_size
+        return total
+
+    @staticmethod
+    def _row_group_in_range(row_group_metadata, filters):
+        """Check whether the time statistics of a row group can match the ('time', op, bound) filters."""
+        for column in range(row_group_metadata.num_columns):
+            chunk = row_group_metadata.column(column)
+            if chunk.path_in_schema != 'time' or chunk.statistics is None or not chunk.statistics.has_min_max:
+                continue
+            low, high = pd.Timestamp(chunk.statistics.min), pd.Timestamp(chunk.statistics.max)
+            for _, op, bound in filters:
+                if (op == '>=' and high < bound) or (op == '<' and low >= bound):
+                    return False
+        return True
+
+    def _read_parquet_columns(self, file_path, columns, start_date=None, end_date=None):
+        """Read the given columns of a parquet file into a DataFrame and count the rows and bytes read.
+
+        start_date/end_date select the quotes of an options file by trade date; pyarrow skips row groups
+        outside the range and filters the rows of the others.
+        """
+        parquet_file = pq.ParquetFile(file_path)
+        filters = self._trade_date_filters(parquet_file, start_date, end_date)
+        if filters is None:
+            table = parquet_file.read(columns=columns, use_pandas_metadata=True)
+        else:
+            table = pq.read_table(file_path, columns=columns, filters=filters)
+        self._record_read(table.num_rows, self._column_bytes(parquet_file, columns, filters))
+        return table.to_pandas()
+
     def get_folder_path(self, folder_name):
         """Get the path to a specific folder inside the base directory."""
         return os.path.join(self.base_folder, folder_name)
@@ -16,26 +124,272 @@ class DataHandler:
             tickers_df = pd.read_csv(tickers_path)
             return tickers_df['Symbol']
         except FileNotFoundError:
-            print(f"Ticker file {file_name} not found in base directory {self.base_folder}.")
+            logger.error("Ticker file %s not found in base directory %s.", file_name, self.base_folder)
             return None
 
     def load_parquet_file(self, folder_path, ticker):
         """Load a parquet file for the given ticker."""
         file_path = os.path.join(folder_path, f"{ticker}.parquet")
         
-        # Print the file path for debugging
-        print(f"Attempting to load file from: {file_path}")
+        # Log the file path for debugging
+        logger.debug("Attempting to load file from: %s", file_path)
         
         # Check if the file exists
         if not os.path.exists(file_path):
-            print(f"File not found: {file_path}")
+            logger.debug("File not found: %s", file_path)
             return None
         
         # Load the parquet file
         try:
             df = pd.read_parquet(file_path)
-            print(f"Successfully loaded file for ticker: {ticker}")
+            self._record_read(len(df), os.path.getsize(file_path))
+            logger.debug("Successfully loaded file for ticker: %s", ticker)
             return df
         except Exception as e:
-            print(f"Error loading file for ticker {ticker}: {e}")
-            return None
\ No newline at end of file
+            logger.warning("Error loading file for ticker %s: %s", ticker, e)
+            return None
+
+    def load_bars(self, folder_path, ticker):
+        """Load the OHLC daily bars for the given ticker, reading each file at most once per run."""
+        key = (os.path.abspath(folder_path), ticker)
+
+        # Serve from the cache and mark the entry as most recently used
+        with self._bar_cache_lock:
+            if key in self._bar_cache:
+                self.cache_hits += 1
+                self._bar_cache.move_to_end(key)
+                df = self._bar_cache[key]
+                self._record_read(len(df), 0)
+                return df
+            self.cache_misses += 1
+
+        df = self._read_bars(folder_path, ticker)
+        if df is None:
+            return None
+
+        with self._bar_cache_lock:
+            self._bar_cache[key] = df
+            if len(self._bar_cache) > self.bar_cache_size:
+                self._bar_cache.popitem(last=False)
+        return df
+
+    def _read_bars(self, folder_path, ticker):
+        """Read the OHLC columns of a ticker's daily bars file."""
+        file_path = os.path.join(folder_path, f"{ticker}.parquet")
+        try:
+            df = self._read_parquet_columns(file_path, BAR_COLUMNS)
+        except FileNotFoundError:
+            logger.debug("File not found: %s", file_path)
+            return None
+        except Exception as e:
+            logger.warning("Error loading file for ticker %s: %s", ticker, e)
+            return None
+
+        # Convert the index once so the estimators can filter by date directly
+        df.index = pd.to_datetime(df.index)
+        return df
+
+    def load_bar_arrays(self, folder_path, ticker):
+        """Load the OHLC bars of a ticker as NumPy arrays, with the first and last dates of its file.
+
+        With a bar store configured the arrays are zero-copy slices of the memory-mapped store, and a
+        warning is logged if the ticker's file in folder_path changed since the store was built;
+        otherwise they are extracted from the cached parquet frame. Returns None if there are no bars.
+        """
+        if self.bar_store_path:
+            columns, index = self._open_bar_store()
+            if ticker not in index:
+                logger.debug("Ticker %s not found in bar store %s", ticker, self.bar_store_path)
+                return None
+            start, stop, first_date, last_date, *source_fingerprint = index[ticker]
+            self._check_bar_store_source(folder_path, ticker, source_fingerprint)
+            bars = Bars(*(column[start:stop] for column in columns))
+            self._record_read(stop - start, sum(array.nbytes for array in bars))
+            return bars, pd.Timestamp(first_date), pd.Timestamp(last_date)
+
+        df = self.load_bars(folder_path, ticker)
+        if df is None:
+            return None
+        return VolatilityEngine.to_bars(df, ticker), df.index[0], df.index[-1]
+
+    def _open_bar_store(self):
+        """Memory-map the bar store once and return its column arrays and ticker index."""
+        with self._bar_store_lock:
+            if self._bar_store is None:
+                table = ipc.open_file(pa.memory_map(self.bar_store_path, 'r')).read_all()
+                index = json.loads(table.schema.metadata[BAR_STORE_INDEX_KEY])
+                columns = [table.column(name).combine_chunks().to_numpy(zero_copy_only=True) for name in Bars._fields]
+                self._bar_store = (columns, index)
+            return self._bar_store
+
+    def _check_bar_store_source(self, folder_path, ticker, source_fingerprint):
+        """Record a ticker whose bars file no longer matches the (size, mtime) saved in the bar store, warning on the first."""
+        if not source_fingerprint or ticker in self.stale_bar_store_tickers:
+            return
+        if file_fingerprint(os.path.join(folder_path, f"{ticker}.parquet")) == tuple(source_fingerprint):
+            return
+        with self._bar_store_lock:
+            first_stale = not self.stale_bar_store_tickers
+            self.stale_bar_store_tickers.add(ticker)
+        if first_stale:
+            logger.warning("Bars of %s changed since the bar store %s was built; serving the stored bars. "
+                           "Rebuild it with build_bar_store after each bars update.", ticker, self.bar_store_path)
+
+    def build_bar_store(self, folder_path, store_path, tickers=None):
+        """Pack the OHLC bars of every ticker into one Arrow IPC file with a ticker -> row range index.
+
+        The store is a snapshot: rebuild it after the daily-bars files are updated. The size and mtime
+        of each source file are saved in the index, so load_bar_arrays can detect a stale store.
+        """
+        if tickers is None:
+            tickers = [name[:-len('.parquet')] for name in sorted(os.listdir(folder_path)) if name.endswith('.parquet')]
+
+        chunks = []
+        index = {}
+        row = 0
+        for ticker in tickers:
+            df = self._read_bars(folder_path, ticker)
+            if df is None:
+                continue
+            bars = VolatilityEngine.to_bars(df, ticker)
+            chunks.append(bars)
+            index[ticker] = [row, row + len(bars.close), str(df.index[0]), str(df.index[-1]),
+                             *file_fingerprint(os.path.join(folder_path, f"{ticker}.parquet"))]
+            row += len(bars.close)
+
+        # One contiguous record batch, so every column maps to a single zero-copy buffer
+        arrays = []
+        for field in Bars._fields:
+            dtype = 'datetime64[us]' if field == 'dates' else np.float64
+            values = [getattr(bars, field).astype(dtype, copy=False) for bars in chunks]
+            arrays.append(pa.array(np.concatenate(values) if values else np.empty(0, dtype=dtype)))
+        table = pa.table(arrays, names=list(Bars._fields))
+        table = table.replace_schema_metadata({BAR_STORE_INDEX_KEY: json.dumps(index)})
+
+        with atomic_write(store_path) as tmp_path:
+            with pa.OSFile(tmp_path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+        return store_path
+
+    def clear_bar_cache(self):
+        """Drop all cached bars and reset the hit/miss counters."""
+        with self._bar_cache_lock:
+            self._bar_cache.clear()
+            self.cache_hits = 0
+            self.cache_misses = 0
+
+    def cache_stats(self):
+        """Return the bar cache hit/miss counters."""
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'size': len(self._bar_cache),
+            'max_size': self.bar_cache_size,
+        }
+
+    def report_cache_stats(self):
+        """Print the bar cache hit/miss counters."""
+        if self.bar_store_path:
+            logger.info("Bars served from the memory-mapped bar store %s", self.bar_store_path)
+            if self.stale_bar_store_tickers:
+                logger.warning("%d tickers changed since the bar store was built (e.g. %s); rebuild it with build_bar_store",
+                               len(self.stale_bar_store_tickers), ", ".join(sorted(self.stale_bar_store_tickers)[:5]))
+            return
+        stats = self.cache_stats()
+        logger.info("Bar cache: %d hits, %d misses, %d/%d tickers cached",
+                    stats['hits'], stats['misses'], stats['size'], stats['max_size'])
+
+    @staticmethod
+    def _trade_date_filters(parquet_file, start_date=None, end_date=None):
+        """Build pyarrow filters selecting the quotes traded from start_date to end_date inclusive.
+
+        Dates are compared in the timezone of the quotes, matching Series.dt.date.
+        """
+        if start_date is None and end_date is None:
+            return None
+        tz = parquet_file.schema_arrow.field('time').type.tz
+        filters = []
+        for op, trade_date, offset in (('>=', start_date, 0), ('<', end_date, 1)):
+            if trade_date is None:
+                continue
+            bound = pd.Timestamp(pd.to_datetime(trade_date).date()) + pd.Timedelta(days=offset)
+            filters.append(('time', op, bound.tz_localize(tz) if tz is not None else bound))
+        return filters or None
+
+    def bar_input_path(self, folder_path, ticker):
+        """Return the file the bars of a ticker are read from."""
+        return self.bar_store_path if self.bar_store_path else os.path.join(folder_path, f"{ticker}.parquet")
+
+    def options_input_path(self, folder_path, ticker, iv_date):
+        """Return the file the options quotes of a ticker on iv_date are read from, and whether it is a trade date partition."""
+        trade_date = pd.to_datetime(iv_date).date()
+        partition_path = os.path.join(folder_path, f"{TRADE_DATE_PARTITION}{trade_date}", f"{ticker}.parquet")
+        if os.path.exists(partition_path):
+            return partition_path, True
+        return os.path.join(folder_path, f"{ticker}.parquet"), False
+
+    def load_options_for_date(self, folder_path, ticker, iv_date, columns=None):
+        """Load the options rows of a ticker quoted on iv_date, reading only the requested columns.
+
+        A store rewritten by partition_options_store is read from the partition of iv_date; a flat
+        per-ticker file is read filtered to the rows of iv_date.
+        """
+        columns = list(columns) if columns else IV_COLUMNS
+        file_path, is_partition = self.options_input_path(folder_path, ticker, iv_date)
+        if is_partition:
+            return self._read_parquet_columns(file_path, columns)
+
+        trade_date = pd.to_datetime(iv_date).date()
+        return self._read_parquet_columns(file_path, columns, trade_date, trade_date)
+
+    def load_options_history(self, folder_path, ticker, columns=None, start_date=None, end_date=None):
+        """Load the options rows of a ticker over a range of trade dates, reading only the requested columns."""
+        columns = list(columns) if columns else IV_COLUMNS
+
+        file_path = os.path.join(folder_path, f"{ticker}.parquet")
+        if os.path.exists(file_path):
+            return self._read_parquet_columns(file_path, columns, start_date, end_date)
+
+        # Gather the ticker's file from every trade date partition in range
+        start = str(pd.to_datetime(start_date).date()) if start_date is not None else None
+        end = str(pd.to_datetime(end_date).date()) if end_date is not None else None
+        frames = []
+        for name in sorted(os.listdir(folder_path)):
+            if not name.startswith(TRADE_DATE_PARTITION):
+                continue
+            trade_date = name[len(TRADE_DATE_PARTITION):]
+            if (start is not None and trade_date < start) or (end is not None and trade_date > end):
+                continue
+            partition_path = os.path.join(folder_path, name, f"{ticker}.parquet")
+            if os.path.exists(partition_path):
+                frames.append(self._read_parquet_columns(partition_path, columns))
+        if not frames:
+            raise FileNotFoundError(f"No options data for {ticker} in {folder_path}")
+        return pd.concat(frames, ignore_index=True)
+
+    def write_options_partition(self, folder_path, ticker, trade_date, df):
+        """Write a ticker's options quotes of one trade date into the partitioned store, returning the file path."""
+        trade_date = pd.to_datetime(trade_date).date()
+        partition_folder = os.path.join(folder_path, f"{TRADE_DATE_PARTITION}{trade_date}")
+        os.makedirs(partition_folder, exist_ok=True)
+        file_path = os.path.join(partition_folder, f"{ticker}.parquet")
+        with atomic_write(file_path) as tmp_path:
+            df.to_parquet(tmp_path, index=False)
+        return file_path
+
+    def partition_options_store(self, source_folder_path, dest_folder_path, tickers=None):
+        """Rewrite per-ticker options files into one partition per trade date for fast single-date lookups."""
+        if tickers is None:
+            tickers = [name[:-len('.parquet')] for name in sorted(os.listdir(source_folder_path)) if name.endswith('.parquet')]
+
+        for ticker in tickers:
+            file_path = os.path.join(source_folder_path, f"{ticker}.parquet")
+            try:
+                df = pd.read_parquet(file_path)
+            except FileNotFoundError:
+                logger.warning("Options data file for %s not found: %s", ticker, file_path)
+                continue
+
+            trade_dates = pd.to_datetime(df['time']).dt.date
+            for trade_date, partition in df.groupby(trade_dates, sort=True):
+                self.write_options_partition(dest_folder_path, ticker, trade_date, partition)
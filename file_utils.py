@@ -0,0 +1,28 @@
+import os
+from contextlib import contextmanager, suppress
+
+
+def file_fingerprint(file_path):
+    """Return the (size, mtime) fingerprint of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+@contextmanager
+def atomic_write(file_path):
+    """Yield a temporary path to write file_path's new contents to, then rename it over file_path.
+
+    Readers never see a partially written file; if the block raises, the temporary file is removed
+    and file_path is left as it was.
+    """
+    tmp_path = f"{file_path}.tmp"
+    try:
+        yield tmp_path
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, file_path)
@@ -0,0 +1,234 @@
+import os
+import logging
+import pickle
+from collections import deque
+import pandas as pd
+import numpy as np
+from file_utils import atomic_write
+from volatility_engine import HORIZONS, Bars, VolatilityEngine
+
+# Bump when the layout of RollingVolState changes, so stale state files are rebuilt
+STATE_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+class RollingVolState:
+    """Running close-close and GKYZ window sums of one ticker, updated in O(1) per appended bar.
+
+    Only the bars still inside the longest window are retained, as plain Python ints (dates in
+    nanoseconds) and floats so the state pickles compactly. Row positions are absolute (counted
+    from the first bar of the file); self.base is the position of the first retained row.
+    """
+
+    def __init__(self, horizons, first_date):
+        self.horizons = dict(horizons)
+        self.first_date = pd.Timestamp(first_date)
+        self.fingerprint = None
+        self.n_rows = 0
+        self.last_bar = None  # (date, open, high, low, close) of the last bar
+        self.base = 0
+        self.dates = deque()
+        self.squared_returns = deque()
+        self.variances = deque()
+
+        # Close-close windows cover rows [cc_start, n_rows); GKYZ windows the last `window` rows
+        self.cc_start = {}
+        self.cc_sum = {}
+        self.cc_nans = {}
+        self.gkyz_sum = {}
+        self.gkyz_nans = {}
+        self.gkyz_last = {}
+
+    @classmethod
+    def from_bars(cls, bars, first_date, horizons=None):
+        """Build the state from a ticker's full bar history."""
+        engine = VolatilityEngine(horizons)
+        state = cls(engine.horizons, first_date)
+        n = len(bars.close)
+        if n == 0:
+            return state
+
+        squared_returns = engine.squared_log_returns(bars)
+        variances = engine.gkyz_variance(bars)
+        dates = bars.dates.astype('datetime64[ns]').astype(np.int64)
+        last_date = pd.Timestamp(bars.dates[-1])
+
+        for period, days in state.horizons.items():
+            start_date = last_date - pd.offsets.BDay(days)
+            start = min(int(np.searchsorted(bars.dates, start_date.to_datetime64(), side='left')) + 1, n)
+            state.cc_start[period] = start
+            state.cc_sum[period] = float(np.nansum(squared_returns[start:]))
+            state.cc_nans[period] = int(np.isnan(squared_returns[start:]).sum())
+
+            window = variances[max(n - days, 0):]
+            state.gkyz_sum[period] = float(np.nansum(window))
+            state.gkyz_nans[period] = int(np.isnan(window).sum())
+
+        # The last valid value may predate the current window, so take it from the engine
+        state.gkyz_last = {period: float(value) for period, value in engine.gkyz_vol(bars, F=1).items()}
+
+        state.n_rows = n
+        state.last_bar = (int(dates[-1]), float(bars.open[-1]), float(bars.high[-1]), float(bars.low[-1]),
+                          float(bars.close[-1]))
+        state.base = state._retained_from()
+        state.dates.extend(dates[state.base:].tolist())
+        state.squared_returns.extend(squared_returns[state.base:].tolist())
+        state.variances.extend(variances[state.base:].tolist())
+        return state
+
+    def _retained_from(self):
+        """Return the first row still needed by any window."""
+        cc_from = min(self.cc_start.values()) - 1
+        gkyz_from = self.n_rows - max(self.horizons.values())
+        return max(min(cc_from, gkyz_from), 0)
+
+    def _add(self, sums, nans, period, value):
+        if value != value:  # NaN
+            nans[period] += 1
+        else:
+            sums[period] += value
+
+    def _remove(self, sums, nans, period, value):
+        if value != value:  # NaN
+            nans[period] -= 1
+        else:
+            sums[period] -= value
+
+    def can_extend(self, bars, first_date):
+        """Check that bars start with the history this state was built from.
+
+        Besides the first date and the last bar, the dates and per-bar terms of every retained row are
+        recomputed from bars and compared, so a bar rewritten inside any window forces a rebuild.
+        """
+        n = self.n_rows
+        if n == 0 or len(bars.close) < n or pd.Timestamp(first_date) != self.first_date:
+            return False
+        date, open_, high, low, close = self.last_bar
+        last = n - 1
+        if not (pd.Timestamp(bars.dates[last]).value == date and bars.open[last] == open_
+                and bars.high[last] == high and bars.low[last] == low and bars.close[last] == close):
+            return False
+
+        # The terms of the first retained row need the close before it
+        start = max(self.base - 1, 0)
+        retained = Bars(*(values[start:n] for values in bars))
+        offset = self.base - start
+        dates = retained.dates[offset:].astype('datetime64[ns]').astype(np.int64)
+        return (np.array_equal(dates, np.array(self.dates, dtype=np.int64))
+                and np.allclose(VolatilityEngine.squared_log_returns(retained)[offset:], np.array(self.squared_returns),
+                                rtol=1e-12, atol=0.0, equal_nan=True)
+                and np.allclose(VolatilityEngine.gkyz_variance(retained)[offset:], np.array(self.variances),
+                                rtol=1e-12, atol=0.0, equal_nan=True))
+
+    def append(self, date, open_, high, low, close):
+        """Roll every window forward by one bar."""
+        last_date = pd.Timestamp(date)
+        date = last_date.value
+        open_, high, low, close = float(open_), float(high), float(low), float(close)
+        squared_return, variance = VolatilityEngine.bar_terms(self.last_bar[4], open_, high, low, close)
+        squared_return, variance = float(squared_return), float(variance)
+
+        row = self.n_rows
+        self.dates.append(date)
+        self.squared_returns.append(squared_return)
+        self.variances.append(variance)
+        self.n_rows += 1
+        self.last_bar = (date, open_, high, low, close)
+
+        for period, days in self.horizons.items():
+            # Close-close: add the new return, then drop the rows that fell out of the date range
+            self._add(self.cc_sum, self.cc_nans, period, squared_return)
+            start_date = (last_date - pd.offsets.BDay(days)).value
+            first_row = self.cc_start[period] - 1
+            while first_row < row and self.dates[first_row - self.base] < start_date:
+                first_row += 1
+            start = min(first_row + 1, self.n_rows)
+            for dropped in range(self.cc_start[period], start):
+                self._remove(self.cc_sum, self.cc_nans, period, self.squared_returns[dropped - self.base])
+            self.cc_start[period] = start
+
+            # GKYZ: add the new variance and drop the one leaving the fixed-size window
+            self._add(self.gkyz_sum, self.gkyz_nans, period, variance)
+            if row - days >= 0:
+                self._remove(self.gkyz_sum, self.gkyz_nans, period, self.variances[row - days - self.base])
+            if self.n_rows >= days and self.gkyz_nans[period] == 0 and self.gkyz_sum[period] >= 0:
+                self.gkyz_last[period] = float(np.sqrt(252 / days) * np.sqrt(self.gkyz_sum[period]))
+
+        # Forget the rows no window needs any more
+        retained_from = self._retained_from()
+        while self.base < retained_from:
+            self.dates.popleft()
+            self.squared_returns.popleft()
+            self.variances.popleft()
+            self.base += 1
+
+    def extend(self, bars):
+        """Append the bars after the last one already in the state."""
+        for row in range(self.n_rows, len(bars.close)):
+            self.append(bars.dates[row], bars.open[row], bars.high[row], bars.low[row], bars.close[row])
+
+    def close_close_vol(self):
+        """Return the close-close realized volatility for every horizon, as VolatilityEngine.close_close_vol."""
+        close_close_rv = {}
+        last_date = pd.Timestamp(self.last_bar[0]) if self.last_bar else None
+        for period, days in self.horizons.items():
+            if last_date is None or last_date - pd.offsets.BDay(days) < self.first_date:
+                close_close_rv[period] = np.nan
+                continue
+
+            N = (self.n_rows - self.cc_start[period]) - self.cc_nans[period]
+            if N < 2:
+                close_close_rv[period] = np.nan
+                continue
+
+            sample_variance = np.sqrt(max(self.cc_sum[period], 0.0) / N)
+            population_variance = sample_variance * (N / (N - 1))
+            close_close_rv[period] = population_variance * np.sqrt(252)
+        return close_close_rv
+
+    def gkyz_vol(self):
+        """Return the last valid rolling GKYZ realized volatility for every horizon."""
+        return {period: self.gkyz_last.get(period, np.nan) for period in self.horizons}
+
+
+def update_state(state, bars, first_date, fingerprint, horizons=None):
+    """Extend a ticker's state with its new bars, rebuilding it when the file history was rewritten (see can_extend)."""
+    if bars is None:
+        return state
+    if state is None or not state.can_extend(bars, first_date):
+        state = RollingVolState.from_bars(bars, first_date, horizons)
+    else:
+        state.extend(bars)
+    state.fingerprint = fingerprint
+    return state
+
+
+class IncrementalStateStore:
+    """Per-ticker rolling states persisted to a single pickle file between daily runs."""
+
+    def __init__(self, state_path, horizons=None):
+        self.state_path = state_path
+        self.horizons = dict(horizons if horizons else HORIZONS)
+        self.states = {}
+
+    def load(self):
+        """Load the saved states, discarding them if they were built for other horizons."""
+        if not os.path.exists(self.state_path):
+            return self
+        try:
+            with open(self.state_path, 'rb') as f:
+                saved = pickle.load(f)
+        except Exception as e:
+            logger.warning("Ignoring unreadable state file %s: %s", self.state_path, e)
+            return self
+
+        if saved.get('version') == STATE_VERSION and saved.get('horizons') == self.horizons:
+            self.states = saved['states']
+        return self
+
+    def save(self):
+        """Write the states atomically, so an interrupted run leaves the previous file intact."""
+        with atomic_write(self.state_path) as tmp_path, open(tmp_path, 'wb') as f:
+            pickle.dump({'version': STATE_VERSION, 'horizons': self.horizons, 'states': self.states}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,143 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class NullSink:
+    """Metrics sink that discards every record."""
+
+    def write(self, record):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    """Metrics sink appending one JSON object per record to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', buffering=1024 * 1024)
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class StageMetrics:
+    """Per-ticker timings, rows, bytes read and failures of one pipeline stage."""
+
+    def __init__(self, name, sink):
+        self.name = name
+        self.sink = sink
+        self.tickers = 0
+        self.failures = 0
+        self.rows = 0
+        self.bytes_read = 0
+        self.load_time = 0.0
+        self.compute_time = 0.0
+
+    def record_ticker(self, ticker, load_time=0.0, compute_time=0.0, rows=0, bytes_read=0, error=None):
+        """Record one processed (or failed) ticker."""
+        self.tickers += 1
+        self.rows += rows
+        self.bytes_read += bytes_read
+        self.load_time += load_time
+        self.compute_time += compute_time
+        if error is not None:
+            self.failures += 1
+        self.sink.write({
+            'event': 'ticker', 'stage': self.name, 'ticker': ticker, 'load_time': load_time,
+            'compute_time': compute_time, 'rows': rows, 'bytes_read': bytes_read, 'error': error,
+        })
+
+    def add_rows(self, rows):
+        """Count rows processed by a stage that does not work per ticker."""
+        self.rows += rows
+
+
+class RunMetrics:
+    """Collect stage and ticker metrics of a run into a pluggable sink, optionally profiling stages.
+
+    profiler is None, 'cprofile' or 'pyinstrument'; profiles of the stages listed in
+    profile_stages (all stages if None) are written to profile_dir.
+    """
+
+    def __init__(self, sink=None, profiler=None, profile_stages=None, profile_dir='.'):
+        self.sink = sink if sink is not None else NullSink()
+        self.profiler = profiler
+        self.profile_stages = profile_stages
+        self.profile_dir = profile_dir
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage and emit its totals when it ends."""
+        stage_metrics = StageMetrics(name, self.sink)
+        profiler = self._start_profiler(name)
+        start = time.perf_counter()
+        try:
+            yield stage_metrics
+        finally:
+            wall_time = time.perf_counter() - start
+            self._stop_profiler(name, profiler)
+            self.stages[name] = stage_metrics
+            record = {
+                'event': 'stage', 'stage': name, 'wall_time': wall_time, 'tickers': stage_metrics.tickers,
+                'failures': stage_metrics.failures, 'rows': stage_metrics.rows,
+                'bytes_read': stage_metrics.bytes_read, 'load_time': stage_metrics.load_time,
+                'compute_time': stage_metrics.compute_time,
+            }
+            self.sink.write(record)
+            logger.info("%s: %.3fs, %d tickers (%d failed), %d rows, %.1f MB read", name, wall_time,
+                        stage_metrics.tickers, stage_metrics.failures, stage_metrics.rows,
+                        stage_metrics.bytes_read / 1e6)
+
+    def _start_profiler(self, name):
+        if self.profiler is None or (self.profile_stages is not None and name not in self.profile_stages):
+            return None
+        if self.profiler == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        if self.profiler == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise ImportError("The pyinstrument profiler requires the pyinstrument package.")
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+        raise ValueError(f"Unknown profiler {self.profiler}")
+
+    def _stop_profiler(self, name, profiler):
+        if profiler is None:
+            return
+        file_name = name.lower().replace(' ', '_').replace('/', '_')
+        if self.profiler == 'cprofile':
+            profiler.disable()
+            path = os.path.join(self.profile_dir, f"{file_name}.prof")
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            path = os.path.join(self.profile_dir, f"{file_name}.html")
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+        logger.info("Profile of %s written to %s", name, path)
+
+    def close(self):
+        """Flush and close the sink."""
+        self.sink.close()
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import pandas as pd
+import pyarrow.parquet as pq
+from data_handler import DataHandler
+
+logger = logging.getLogger(__name__)
+
+GREEK_FIELDS = {'iv': 'impliedVol', 'delta': 'delta', 'theta': 'theta', 'vega': 'vega', 'gamma': 'gamma'}
+
+
+class OptionsChainSource(ABC):
+    """Source of the option chain snapshots of a ticker, fetched asynchronously."""
+
+    async def connect(self):
+        """Open the connection to the source, if it needs one."""
+
+    @abstractmethod
+    async def fetch_chain(self, ticker, trade_date):
+        """Return one DataFrame row per quoted contract of ticker on trade_date, in the options store layout."""
+
+    async def close(self):
+        """Release the connection to the source, if it has one."""
+
+
+class FileOptionsSource(OptionsChainSource):
+    """Stand-in source serving chains from pre-dumped per-ticker options files, e.g. for tests and replays.
+
+    delay simulates the latency of a live request, in seconds.
+    """
+
+    def __init__(self, folder_path, data_handler=None, delay=0.0):
+        self.folder_path = folder_path
+        self.data_handler = data_handler if data_handler is not None else DataHandler()
+        self.delay = delay
+
+    async def fetch_chain(self, ticker, trade_date):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return await asyncio.to_thread(self._read_chain, ticker, trade_date)
+
+    def _read_chain(self, ticker, trade_date):
+        file_path, _ = self.data_handler.options_input_path(self.folder_path, ticker, trade_date)
+        filters = DataHandler._trade_date_filters(pq.ParquetFile(file_path), trade_date, trade_date)
+        return pq.read_table(file_path, filters=filters).to_pandas()
+
+
+class IBOptionsSource(OptionsChainSource):
+    """Live option chain snapshots from Interactive Brokers through ib_insync.
+
+    Quotes the strikes_per_expiry strikes closest to spot for the first max_expiries expiries
+    (all if None). Chains are always snapshots of the current market, whatever trade_date is.
+    """
+
+    def __init__(self, host='127.0.0.1', port=7497, client_id=1, max_expiries=None, strikes_per_expiry=10,
+                 market_data_type=1):
+        try:
+            import ib_insync
+        except ImportError:
+            raise ImportError("The Interactive Brokers source requires the ib_insync package.")
+        self._ib_insync = ib_insync
+        self.ib = ib_insync.IB()
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.max_expiries = max_expiries
+        self.strikes_per_expiry = strikes_per_expiry
+        self.market_data_type = market_data_type
+
+    async def connect(self):
+        await self.ib.connectAsync(self.host, self.port, clientId=self.client_id)
+        self.ib.reqMarketDataType(self.market_data_type)
+
+    async def fetch_chain(self, ticker, trade_date):
+        ib_insync = self._ib_insync
+        stock = ib_insync.Stock(ticker, 'SMART', 'USD')
+        await self.ib.qualifyContractsAsync(stock)
+        [stock_ticker] = await self.ib.reqTickersAsync(stock)
+        spot = stock_ticker.marketPrice()
+
+        chains = await self.ib.reqSecDefOptParamsAsync(stock.symbol, '', stock.secType, stock.conId)
+        chain = next((c for c in chains if c.exchange == 'SMART'), None)
+        if chain is None:
+            raise ValueError(f"No SMART option chain for {ticker}")
+        expirations = sorted(chain.expirations)[:self.max_expiries]
+        strikes = sorted(chain.strikes, key=lambda strike: abs(strike - spot))[:self.strikes_per_expiry]
+        contracts = [
+            ib_insync.Option(ticker, expiry, strike, right, 'SMART', tradingClass=chain.tradingClass)
+            for expiry in expirations for strike in sorted(strikes) for right in ('C', 'P')
+        ]
+        contracts = [c for c in await self.ib.qualifyContractsAsync(*contracts) if c.conId]
+        option_tickers = await self.ib.reqTickersAsync(*contracts)
+        return pd.DataFrame([self._quote_row(t) for t in option_tickers])
+
+    @staticmethod
+    def _quote_row(option_ticker):
+        """Flatten a ticker snapshot into the column names of the options store."""
+        contract = option_ticker.contract
+        row = {
+            'time': option_ticker.time, 'marketDataType': option_ticker.marketDataType,
+            'bid': option_ticker.bid, 'bidSize': option_ticker.bidSize,
+            'ask': option_ticker.ask, 'askSize': option_ticker.askSize,
+            'last': option_ticker.last, 'volume': option_ticker.volume,
+            'lastTradeDateOrContractMonth': contract.lastTradeDateOrContractMonth,
+            'strike': contract.strike, 'right': contract.right,
+        }
+        for greeks in ('lastGreeks', 'bidGreeks', 'askGreeks', 'modelGreeks'):
+            computation = getattr(option_ticker, greeks)
+            for column, field in GREEK_FIELDS.items():
+                row[f"{greeks}_{column}"] = getattr(computation, field) if computation is not None else None
+        return row
+
+    async def close(self):
+        self.ib.disconnect()
+
+
+class RateLimiter:
+    """Space request starts at least 1 / rate seconds apart (no limit if rate is None)."""
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            if self._next_start > now:
+                await asyncio.sleep(self._next_start - now)
+                now = self._next_start
+            self._next_start = now + self.interval
+
+
+class OptionsIngestor:
+    """Fetch option chains for many tickers concurrently and write them into the partitioned options store.
+
+    Chains land in store_path/trade_date=YYYY-MM-DD/<ticker>.parquet, which
+    DataHandler.load_options_for_date reads directly. At most max_concurrency requests are in
+    flight and they start at most rate_limit per second.
+    """
+
+    def __init__(self, source, store_path, data_handler=None, max_concurrency=8, rate_limit=None):
+        self.source = source
+        self.store_path = store_path
+        self.data_handler = data_handler if data_handler is not None else DataHandler()
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+
+    async def ingest(self, tickers, trade_date):
+        """Yield (ticker, error) as each ticker's chain is stored, error being None on success."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = RateLimiter(self.rate_limit)
+
+        async def ingest_ticker(ticker):
+            try:
+                async with semaphore:
+                    await limiter.wait()
+                    df = await self.source.fetch_chain(ticker, trade_date)
+                if df.empty:
+                    raise ValueError(f"No option quotes for {ticker} on {trade_date}")
+                await asyncio.to_thread(self.data_handler.write_options_partition, self.store_path, ticker,
+                                        trade_date, df)
+            except Exception as e:
+                logger.debug("%s - options ingest failed: %s", ticker, e)
+                return ticker, e
+            return ticker, None
+
+        await self.source.connect()
+        tasks = [asyncio.create_task(ingest_ticker(ticker)) for ticker in tickers]
+        try:
+            for ingested in asyncio.as_completed(tasks):
+                yield await ingested
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.source.close()
+
+    def run(self, tickers, trade_date):
+        """Ingest every ticker's chain, blocking until done, and return {ticker: error} of the failures."""
+        async def ingest_all():
+            return {ticker: error async for ticker, error in self.ingest(tickers, trade_date) if error is not None}
+        return asyncio.run(ingest_all())
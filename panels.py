@@ -0,0 +1,105 @@
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+# Volatilities and relative differences need no more than single precision
+PANEL_DTYPE = np.float32
+
+
+class ScreenResult(NamedTuple):
+    """Output of screen_relative_differences."""
+    combined: pd.DataFrame  # Weighted relative difference, time horizons x stocks
+    positive_counts: pd.Series  # Horizons at or above threshold_plus, per stock
+    negative_counts: pd.Series  # Horizons at or below threshold_neg, per stock
+    top_positive_stocks: pd.Index
+    top_negative_stocks: pd.Index
+
+
+def to_panel(results, horizons):
+    """Build a float32 time horizons x stocks panel from {ticker: {horizon: value}} results, NaN where missing."""
+    tickers = list(results)
+    values = np.full((len(horizons), len(tickers)), np.nan, dtype=PANEL_DTYPE)
+    for column, ticker in enumerate(tickers):
+        by_horizon = results[ticker]
+        values[:, column] = [by_horizon.get(horizon, np.nan) for horizon in horizons]
+    return pd.DataFrame(values, index=pd.Index(horizons), columns=pd.Index(tickers))
+
+
+def _aligned_values(panel, index, columns):
+    """Return the values of a panel (or a per-stock Series, as a single row) lined up with index x columns by label."""
+    if isinstance(panel, pd.Series):
+        return panel.reindex(columns).to_numpy(dtype=PANEL_DTYPE)[np.newaxis, :]
+    return panel.reindex(index=index, columns=columns).to_numpy(dtype=PANEL_DTYPE)
+
+
+def relative_differences(gkyz_panel, close_close_panel, implied_vol):
+    """Return the (GKYZ, close-close) relative differences of implied volatility, as float32 panels.
+
+    Both RV panels and the implied volatility (a panel or a per-stock Series) are aligned to the
+    GKYZ panel by horizon and ticker, so a stock missing from one input is NaN instead of shifting
+    the others. A per-stock Series is broadcast across horizons.
+    """
+    index, columns = gkyz_panel.index, gkyz_panel.columns
+    gkyz = gkyz_panel.to_numpy(dtype=PANEL_DTYPE)
+    close_close = _aligned_values(close_close_panel, index, columns)
+    iv = _aligned_values(implied_vol, index, columns)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative_diff_gkyz = np.subtract(iv, gkyz)
+        relative_diff_gkyz /= gkyz
+        relative_diff_close_close = np.subtract(iv, close_close)
+        relative_diff_close_close /= close_close
+    return (pd.DataFrame(relative_diff_gkyz, index=index, columns=columns),
+            pd.DataFrame(relative_diff_close_close, index=index, columns=columns))
+
+
+def top_n_positions(values, n, largest=True):
+    """Return the flat positions of the n largest (or smallest) non-NaN values, best first.
+
+    Uses a partial sort (np.partition) to find the cutoff, then fully sorts only the values at or
+    beyond it; ties are broken by position, like DataFrame.nlargest/nsmallest.
+    """
+    values = np.asarray(values).ravel()
+    valid = np.flatnonzero(~np.isnan(values)) if values.dtype.kind == 'f' else np.arange(values.size)
+    keys = -values[valid] if largest else values[valid]
+    n = min(n, keys.size)
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+    cutoff = np.partition(keys, n - 1)[n - 1]
+    candidates = np.flatnonzero(keys <= cutoff)
+    return valid[candidates[np.argsort(keys[candidates], kind='stable')[:n]]]
+
+
+def screen_relative_differences(gkyz_panel, close_close_panel, implied_vol, weight_gkyz=0.6,
+                                weight_close_close=0.4, threshold_plus=0.75, threshold_neg=-0.5, top_n=20):
+    """Fused relative difference screen: weighted combination, threshold counts and top N stocks in one pass.
+
+    Inputs are aligned as in relative_differences; the combined panel is computed in place in a
+    single float32 buffer, and NaNs never count towards a threshold.
+    """
+    index, columns = gkyz_panel.index, gkyz_panel.columns
+    gkyz = gkyz_panel.to_numpy(dtype=PANEL_DTYPE)
+    close_close = _aligned_values(close_close_panel, index, columns)
+    iv = _aligned_values(implied_vol, index, columns)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # weight_gkyz * (iv - gkyz) / gkyz + weight_close_close * (iv - close_close) / close_close
+        combined = np.subtract(iv, gkyz)
+        combined /= gkyz
+        combined *= weight_gkyz
+        close_close_term = np.subtract(iv, close_close)
+        close_close_term /= close_close
+        close_close_term *= weight_close_close
+        combined += close_close_term
+        del close_close_term
+
+        positive_counts = np.count_nonzero(combined >= threshold_plus, axis=0)
+        negative_counts = np.count_nonzero(combined <= threshold_neg, axis=0)
+
+    return ScreenResult(
+        combined=pd.DataFrame(combined, index=index, columns=columns),
+        positive_counts=pd.Series(positive_counts, index=columns),
+        negative_counts=pd.Series(negative_counts, index=columns),
+        top_positive_stocks=columns[top_n_positions(positive_counts, top_n)],
+        top_negative_stocks=columns[top_n_positions(negative_counts, top_n)],
+    )
@@ -0,0 +1,8 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool(max_workers):
+    """Return a ProcessPoolExecutor that forks where available, so worker processes do not re-import the calling script."""
+    mp_context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+from file_utils import atomic_write, file_fingerprint
+
+# Bump when the computations change, so results cached by older code are not reused
+CACHE_VERSION = 3
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """Persistent per-ticker results, keyed on input file fingerprints and stage parameters.
+
+    Each (stage, parameters) pair is stored as one pickle file mapping ticker -> (input
+    fingerprints, result), so a rerun only recomputes the tickers whose inputs changed. Files are
+    evicted least recently used first once the cache directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, hash_contents=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_contents = hash_contents
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def fingerprint(self, file_path):
+        """Return the (size, mtime[, content hash]) fingerprint of a file, or None if it does not exist."""
+        fingerprint = file_fingerprint(file_path)
+        if fingerprint is None or not self.hash_contents:
+            return fingerprint
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return fingerprint + (digest.hexdigest(),)
+
+    def _path(self, kind, key):
+        payload = json.dumps([CACHE_VERSION, kind, key], sort_keys=True, default=str)
+        name = hashlib.sha1(payload.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{kind.lower().replace(' ', '_')}-{name}.pkl")
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable cache file %s: %s", path, e)
+            return None
+        os.utime(path)  # Mark as recently used for eviction
+        return value
+
+    def _write(self, path, value):
+        with atomic_write(path) as tmp_path, open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.evict()
+
+    def load_stage(self, stage, params):
+        """Return the cached {ticker: (fingerprints, result)} entries of a stage run with params."""
+        return self._read(self._path(stage, params)) or {}
+
+    def save_stage(self, stage, params, entries):
+        """Store the {ticker: (fingerprints, result)} entries of a stage run with params."""
+        self._write(self._path(stage, params), entries)
+
+    def evict(self):
+        """Delete least recently used cache files until the cache fits in max_bytes."""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.debug("Evicted cache file %s", path)
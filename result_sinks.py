@@ -0,0 +1,49 @@
+import logging
+from contextlib import ExitStack
+import pyarrow as pa
+import pyarrow.parquet as pq
+from file_utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class ParquetResultSink:
+    """Result sink appending each chunk of a streamed run to one parquet file as a row group.
+
+    The schema is fixed by the first chunk; the file is complete once close() is called.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._writer = None
+        self._replace = ExitStack()  # Renames the finished file over path when closed
+
+    def write(self, frame):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            tmp_path = self._replace.enter_context(atomic_write(self.path))
+            self._writer = pq.ParquetWriter(tmp_path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+        self.rows += len(frame)
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        # Only replace the previous results once the whole run was written
+        self._replace.close()
+        logger.info("Wrote %d result rows to %s", self.rows, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._writer is not None:
+            # Keep the previous results of an interrupted run
+            self._writer.close()
+            self._writer = None
+            self._replace.__exit__(exc_type, exc, tb)
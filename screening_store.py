@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from file_utils import atomic_write
+from panels import PANEL_DTYPE, top_n_positions
+
+# Bump when the on-disk layout changes
+SCREENING_STORE_VERSION = 1
+INDEX_FILE = 'index.json'
+
+logger = logging.getLogger(__name__)
+
+
+class ScreeningStore:
+    """Append-only store of daily combined relative difference panels, for screens over their history.
+
+    Each day is one float32 .npy file of shape (time horizons, stocks), memory-mapped on read.
+    index.json lists the horizons, the dates and every ticker seen so far; a day's columns follow
+    that ticker list up to the tickers known when it was appended, so older days never need
+    rewriting when new tickers appear.
+    """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.horizons = None
+        self.tickers = []
+        self.dates = []
+        self._columns = {}  # Date -> number of ticker columns in its file
+        os.makedirs(store_path, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        index_path = os.path.join(self.store_path, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get('version') != SCREENING_STORE_VERSION:
+            raise ValueError(f"Unsupported screening store version {index.get('version')} in {self.store_path}")
+        self.horizons = index['horizons']
+        self.tickers = index['tickers']
+        self.dates = [day['date'] for day in index['days']]
+        self._columns = {day['date']: day['columns'] for day in index['days']}
+
+    def _save_index(self):
+        index = {
+            'version': SCREENING_STORE_VERSION, 'horizons': self.horizons, 'tickers': self.tickers,
+            'days': [{'date': date, 'columns': self._columns[date]} for date in self.dates],
+        }
+        with atomic_write(os.path.join(self.store_path, INDEX_FILE)) as tmp_path, open(tmp_path, 'w') as f:
+            json.dump(index, f)
+
+    def _day_path(self, date):
+        return os.path.join(self.store_path, f"{date}.npy")
+
+    def append(self, date, combined_relative_diff, overwrite=False):
+        """Add the combined relative difference panel (time horizons x stocks) of a day."""
+        date = str(pd.to_datetime(date).date())
+        horizons = [str(horizon) for horizon in combined_relative_diff.index]
+        if self.horizons is None:
+            self.horizons = horizons
+        elif horizons != self.horizons:
+            raise ValueError(f"Panel horizons {horizons} do not match the store horizons {self.horizons}")
+        if date in self._columns and not overwrite:
+            raise ValueError(f"{date} is already in the screening store {self.store_path}")
+
+        # Register new tickers, then lay the day out in store ticker order
+        known = set(self.tickers)
+        self.tickers.extend(str(ticker) for ticker in combined_relative_diff.columns if str(ticker) not in known)
+        values = combined_relative_diff.rename(columns=str).reindex(columns=self.tickers).to_numpy(dtype=PANEL_DTYPE)
+
+        with atomic_write(self._day_path(date)) as tmp_path, open(tmp_path, 'wb') as f:
+            np.save(f, values)
+
+        if date not in self._columns:
+            self.dates.append(date)
+            self.dates.sort()
+        self._columns[date] = len(self.tickers)
+        self._save_index()
+
+    def load(self, start_date=None, end_date=None, last_n_days=None):
+        """Return (dates, values) of the stored days in range, values shaped (days, time horizons, stocks).
+
+        Stocks follow self.tickers; a stock not yet known on a day is NaN.
+        """
+        dates = self.dates
+        if start_date is not None:
+            dates = [date for date in dates if date >= str(pd.to_datetime(start_date).date())]
+        if end_date is not None:
+            dates = [date for date in dates if date <= str(pd.to_datetime(end_date).date())]
+        if last_n_days is not None:
+            dates = dates[-last_n_days:] if last_n_days > 0 else []
+
+        values = np.full((len(dates), len(self.horizons or []), len(self.tickers)), np.nan, dtype=PANEL_DTYPE)
+        for d, date in enumerate(dates):
+            day = np.load(self._day_path(date), mmap_mode='r')
+            values[d, :, :day.shape[1]] = day
+        return pd.DatetimeIndex(dates), values
+
+    def panel(self, date):
+        """Return the stored panel of one day as a time horizons x stocks DataFrame."""
+        _, values = self.load(start_date=date, end_date=date)
+        if len(values) == 0:
+            raise KeyError(f"{date} is not in the screening store {self.store_path}")
+        return pd.DataFrame(values[0], index=self.horizons, columns=self.tickers)
+
+    def top_per_horizon(self, last_n_days=20, top_n=20, rich=True):
+        """Rank the top_n richest (or cheapest) stocks of every horizon by mean relative difference over the last days.
+
+        Rich stocks have implied volatility furthest above realized; cheap ones furthest below.
+        Returns a DataFrame with one row per (horizon, rank) holding the ticker, its mean
+        relative difference and the number of days it was observed.
+        """
+        _, values = self.load(last_n_days=last_n_days)
+        observed = np.count_nonzero(~np.isnan(values), axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nansum(values, axis=0, dtype=np.float64) / observed  # NaN where never observed
+
+        rows = []
+        for horizon, horizon_mean, horizon_observed in zip(self.horizons or [], mean, observed):
+            for rank, position in enumerate(top_n_positions(horizon_mean, top_n, largest=rich), start=1):
+                rows.append((horizon, rank, self.tickers[position], horizon_mean[position],
+                             horizon_observed[position]))
+        return pd.DataFrame(rows, columns=['horizon', 'rank', 'ticker', 'mean_relative_diff', 'days']
+                            ).set_index(['horizon', 'rank'])
+
+    def streaks(self, threshold, min_days, above=True, horizons=None):
+        """Find the stocks whose relative difference has been beyond threshold on each of the latest min_days days or more.
+
+        above selects values at or above threshold (rich), otherwise at or below (cheap). Returns
+        one row per (horizon, ticker) with the length of its current run, longest first.
+        """
+        _, values = self.load()
+        all_horizons = self.horizons or []
+        horizon_rows = [all_horizons.index(h) for h in (horizons if horizons is not None else all_horizons)]
+        values = values[:, horizon_rows, :]
+        with np.errstate(invalid='ignore'):
+            beyond = values >= threshold if above else values <= threshold
+
+        # Length of the run ending on the latest day: position of the latest day not beyond the threshold
+        n_days = beyond.shape[0]
+        broken = ~beyond[::-1]
+        run_lengths = np.where(broken.any(axis=0), broken.argmax(axis=0), n_days)
+
+        horizon_positions, ticker_positions = np.nonzero(run_lengths >= max(min_days, 1))
+        result = pd.DataFrame({
+            'horizon': [self.horizons[horizon_rows[h]] for h in horizon_positions],
+            'ticker': [self.tickers[t] for t in ticker_positions],
+            'days': run_lengths[horizon_positions, ticker_positions],
+        })
+        return result.sort_values(['days', 'horizon', 'ticker'], ascending=[False, True, True], ignore_index=True)
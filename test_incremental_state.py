@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from incremental_state import RollingVolState, update_state
+from volatility_engine import Bars, VolatilityEngine
+
+
+def make_bars(n=600, seed=0):
+    """Random-walk daily OHLC bars on business days."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2020-01-01', periods=n).to_numpy()
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.01, n)))
+    return Bars(dates, open_, high, low, close)
+
+
+def head(bars, n):
+    return Bars(*(values[:n] for values in bars))
+
+
+def assert_matches_full_recompute(state, bars):
+    engine = VolatilityEngine()
+    first_date, last_date = pd.Timestamp(bars.dates[0]), pd.Timestamp(bars.dates[-1])
+    expected_close_close = engine.close_close_vol(bars, first_date=first_date, last_date=last_date)
+    expected_gkyz = engine.gkyz_vol(bars, F=1)
+    for period in engine.horizons:
+        np.testing.assert_allclose(state.close_close_vol()[period], expected_close_close[period], rtol=1e-12)
+        np.testing.assert_allclose(state.gkyz_vol()[period], expected_gkyz[period], rtol=1e-12)
+
+
+def test_roll_forward_matches_full_recompute():
+    bars = make_bars()
+    first_date = pd.Timestamp(bars.dates[0])
+    state = RollingVolState.from_bars(head(bars, 570), first_date)
+    for n in range(575, len(bars.close) + 1, 5):
+        assert state.can_extend(head(bars, n), first_date)
+        state = update_state(state, head(bars, n), first_date, fingerprint=n)
+        assert_matches_full_recompute(state, head(bars, n))
+
+
+def test_rewritten_bar_inside_window_forces_rebuild():
+    bars = make_bars()
+    first_date = pd.Timestamp(bars.dates[0])
+    state = RollingVolState.from_bars(head(bars, 590), first_date)
+
+    rewritten = Bars(bars.dates, bars.open, bars.high, bars.low, bars.close.copy())
+    rewritten.close[-20] *= 1.5
+    assert not state.can_extend(rewritten, first_date)
+    state = update_state(state, rewritten, first_date, fingerprint=None)
+    assert_matches_full_recompute(state, rewritten)
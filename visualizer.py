@@ -1,83 +1,183 @@
+import logging
+import os
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import seaborn as sns
+import numpy as np
 import pandas as pd
+from panels import top_n_positions
+from parallel import process_pool
+
+logger = logging.getLogger(__name__)
+
+HEATMAP_FIGSIZE = (12, 10)
+
+# Figure reused by every render in a process when exporting files
+_export_figure = None
+
+
+def draw_heatmap(fig, data, title):
+    """Draw a relative difference heatmap (time horizons x stocks) into a cleared figure."""
+    fig.clf()
+    ax = fig.add_subplot()
+    sns.heatmap(
+        data,
+        ax=ax,
+        cmap="coolwarm",
+        center=0,
+        annot=data,
+        fmt=".2f",
+        annot_kws={"size": 10},
+        vmax=2,
+        vmin=-2
+    )
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_horizontalalignment('right')
+        label.set_fontsize(10)
+    for label in ax.get_yticklabels():
+        label.set_rotation(0)
+        label.set_fontsize(10)
+    ax.set_title(title, fontsize=14)
+    ax.set_xlabel("Stocks", fontsize=12)
+    ax.set_ylabel("Time Horizons", fontsize=12)
+    fig.tight_layout()
+    return ax
+
+
+def _get_export_figure():
+    """Return this process's reusable Agg figure, creating it on first use."""
+    global _export_figure
+    if _export_figure is None:
+        _export_figure = Figure(figsize=HEATMAP_FIGSIZE)
+        FigureCanvasAgg(_export_figure)
+    return _export_figure
+
+
+def render_heatmap_file(data, title, path_base, formats):
+    """Render a heatmap with the Agg backend and save it once per format, returning the written paths."""
+    fig = _get_export_figure()
+    draw_heatmap(fig, data, title)
+    paths = []
+    for fmt in formats:
+        path = f"{path_base}.{fmt}"
+        fig.savefig(path, format=fmt)
+        paths.append(path)
+    fig.clf()
+    return paths
+
 
 class Visualizer:
-    def visualize_top_relative_differences(self, combined_relative_diff, N=20):
-        """Visualize the top N highest and lowest relative differences between implied volatility and realized volatilities, with caps on relative values."""
+    def __init__(self, output_dir=None, formats=('png',), n_workers=1):
+        # With an output directory, heatmaps are exported as files instead of shown interactively
+        self.output_dir = output_dir
+        self.formats = tuple(formats)
+        self.n_workers = n_workers
 
+    def select_top_relative_differences(self, combined_relative_diff, N=20):
+        """Select the stocks with the top N highest and lowest capped relative differences.
+
+        Returns the (top positive, top negative) DataFrames of all time horizons for those stocks.
+        """
         # Step 1: Apply cap on the relative values to filter out potential outliers
-        capped_diff = combined_relative_diff[(combined_relative_diff <= 2) & (combined_relative_diff >= -1.75)]
+        values = combined_relative_diff.to_numpy(dtype=np.float64)
+        capped_values = np.where((values <= 2) & (values >= -1.75), values, np.nan)
 
         # Step 2: Identify Top N Positive and Top N Negative Stocks
-        # Flatten the DataFrame to get a long format for sorting
-        combined_long = capped_diff.stack().reset_index()
-        combined_long.columns = ['Time Horizon', 'Stock', 'Relative Difference']
-
-        # Sort by relative difference to get the top N highest and lowest values
-        top_n_highest = combined_long.nlargest(N, 'Relative Difference')
-        top_n_lowest = combined_long.nsmallest(N, 'Relative Difference')
-
-        # Debugging: Print the top N highest and lowest values
-        print(f"Top {N} Highest Relative Differences:")
-        print(top_n_highest)
-        print(f"Top {N} Lowest Relative Differences:")
-        print(top_n_lowest)
+        # Partial sort of the flattened (time horizon, stock) values instead of stacking and sorting them all
+        n_stocks = values.shape[1]
+        highest = top_n_positions(capped_values, N, largest=True)
+        lowest = top_n_positions(capped_values, N, largest=False)
+        stocks = combined_relative_diff.columns
+        horizons = combined_relative_diff.index
+        logger.debug("Top %d Highest Relative Differences:\n%s", N,
+                     list(zip(horizons[highest // n_stocks], stocks[highest % n_stocks], capped_values.ravel()[highest])))
+        logger.debug("Top %d Lowest Relative Differences:\n%s", N,
+                     list(zip(horizons[lowest // n_stocks], stocks[lowest % n_stocks], capped_values.ravel()[lowest])))
 
         # Extract the unique stocks from the top N highest and lowest relative differences
-        top_positive_stocks = top_n_highest['Stock'].unique()
-        top_negative_stocks = top_n_lowest['Stock'].unique()
+        top_positive_stocks = pd.unique(stocks[highest % n_stocks])
+        top_negative_stocks = pd.unique(stocks[lowest % n_stocks])
 
         # Step 3: Filter Original Data for Selected Stocks and Time Horizons
-        # Create filtered DataFrames for the top N positive and negative values
-        top_positive_df = combined_relative_diff.loc[:, top_positive_stocks]
-        top_negative_df = combined_relative_diff.loc[:, top_negative_stocks]
-
         # Ensure the order of time horizons matches the original DataFrame
         time_horizon_order = combined_relative_diff.index
+        top_positive_df = combined_relative_diff.loc[time_horizon_order, top_positive_stocks]
+        top_negative_df = combined_relative_diff.loc[time_horizon_order, top_negative_stocks]
+        return top_positive_df, top_negative_df
 
-        # Plot Heatmap for Top N Positive Stocks
-        if not top_positive_df.empty:
-            plt.figure(figsize=(12, 10))
-            ax = sns.heatmap(
-                top_positive_df.loc[time_horizon_order],
-                cmap="coolwarm",
-                center=0,
-                annot=top_positive_df.loc[time_horizon_order],
-                fmt=".2f",
-                annot_kws={"size": 10},
-                vmax=2,
-                vmin=-2
-            )
-            plt.xticks(rotation=45, ha='right', fontsize=10)
-            plt.yticks(rotation=0, fontsize=10)
-            plt.title(f"Top {N} Stocks with Highest Relative Differences", fontsize=14)
-            plt.xlabel("Stocks", fontsize=12)
-            plt.ylabel("Time Horizons", fontsize=12)
-            plt.tight_layout()
+    def visualize_top_relative_differences(self, combined_relative_diff, N=20):
+        """Visualize the top N highest and lowest relative differences between implied volatility and realized volatilities, with caps on relative values."""
+        top_positive_df, top_negative_df = self.select_top_relative_differences(combined_relative_diff, N)
+        heatmaps = {
+            f"top_{N}_highest": (top_positive_df, f"Top {N} Stocks with Highest Relative Differences"),
+            f"top_{N}_lowest": (top_negative_df, f"Top {N} Stocks with Lowest Relative Differences"),
+        }
+
+        if self.output_dir is not None:
+            return self.export_heatmaps(heatmaps)
+
+        for name, (data, title) in heatmaps.items():
+            if data.empty:
+                logger.info("No data to plot for %s relative differences.", name.replace('_', ' '))
+                continue
+            fig = plt.figure(figsize=HEATMAP_FIGSIZE)
+            draw_heatmap(fig, data, title)
             plt.show()
-        else:
-            print(f"No data to plot for top {N} highest relative differences.")
-
-        # Plot Heatmap for Top N Negative Stocks
-        if not top_negative_df.empty:
-            plt.figure(figsize=(12, 10))
-            ax = sns.heatmap(
-                top_negative_df.loc[time_horizon_order],
-                cmap="coolwarm",
-                center=0,
-                annot=top_negative_df.loc[time_horizon_order],
-                fmt=".2f",
-                annot_kws={"size": 10},
-                vmax=2,
-                vmin=-2
+            plt.close(fig)
+
+    def export_heatmaps(self, heatmaps, output_dir=None):
+        """Render {name: (data, title)} heatmaps to files in output_dir, in parallel when n_workers > 1.
+
+        Returns the written paths in the order of heatmaps.
+        """
+        output_dir = output_dir or self.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        jobs = []
+        for name, (data, title) in heatmaps.items():
+            if data.empty:
+                logger.info("No data to plot for %s.", name)
+                continue
+            jobs.append((data, title, os.path.join(output_dir, name), self.formats))
+
+        if self.n_workers <= 1 or len(jobs) <= 1:
+            return [path for job in jobs for path in render_heatmap_file(*job)]
+
+        with process_pool(self.n_workers) as pool:
+            rendered = [pool.submit(render_heatmap_file, *job) for job in jobs]
+            return [path for future in rendered for path in future.result()]
+
+    def export_horizon_heatmaps(self, combined_relative_diff, N=20, output_dir=None):
+        """Export, for each time horizon, heatmaps of the N stocks with the highest and lowest relative difference on it."""
+        heatmaps = {}
+        values = combined_relative_diff.to_numpy(dtype=np.float64)
+        stocks = combined_relative_diff.columns
+        for horizon, row in zip(combined_relative_diff.index, values):
+            slug = str(horizon).replace(' ', '_')
+            heatmaps[f"{slug}_top_{N}_highest"] = (
+                combined_relative_diff.loc[:, stocks[top_n_positions(row, N, largest=True)]],
+                f"Top {N} Stocks with Highest {horizon} Relative Differences",
             )
-            plt.xticks(rotation=45, ha='right', fontsize=10)
-            plt.yticks(rotation=0, fontsize=10)
-            plt.title(f"Top {N} Stocks with Lowest Relative Differences", fontsize=14)
-            plt.xlabel("Stocks", fontsize=12)
-            plt.ylabel("Time Horizons", fontsize=12)
-            plt.tight_layout()
-            plt.show()
-        else:
-            print(f"No data to plot for top {N} lowest relative differences.")
+            heatmaps[f"{slug}_top_{N}_lowest"] = (
+                combined_relative_diff.loc[:, stocks[top_n_positions(row, N, largest=False)]],
+                f"Top {N} Stocks with Lowest {horizon} Relative Differences",
+            )
+        return self.export_heatmaps(heatmaps, output_dir)
+
+    def export_group_heatmaps(self, combined_relative_diff, groups, N=20, output_dir=None):
+        """Export one heatmap per group (e.g. sector) of its N stocks with the largest absolute relative differences.
+
+        groups maps each ticker to its group name; tickers without a group are skipped.
+        """
+        membership = pd.Series(groups).reindex(combined_relative_diff.columns).dropna()
+        largest = combined_relative_diff.abs().max(axis=0)
+        heatmaps = {}
+        for group, members in membership.groupby(membership):
+            top_stocks = largest[members.index].nlargest(N).index
+            slug = str(group).replace(' ', '_').replace('/', '_')
+            heatmaps[f"{slug}_top_{N}"] = (
+                combined_relative_diff.loc[:, top_stocks],
+                f"{group}: Top {N} Stocks by Absolute Relative Difference",
+            )
+        return self.export_heatmaps(heatmaps, output_dir)
@@ -1,14 +1,30 @@
 from data_handler import DataHandler
 from volatility_calculator import VolatilityCalculator
 from visualizer import Visualizer
+from instrumentation import RunMetrics, JsonLinesSink
+from result_cache import ResultCache
+from screening_store import ScreeningStore
 from datetime import datetime, timedelta, date
+import logging
 import os
+import pandas as pd
+
+# INFO reports stage timings; DEBUG adds per-ticker progress
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 iv_date = date.today() #- timedelta(days=4)# Example date, adjust as needed
+n_workers = 1  # Number of worker processes/reader threads; 1 processes tickers serially
+metrics_path = None  # e.g. "run-metrics.jsonl" to record stage and per-ticker metrics as JSON lines
+report_dir = None  # e.g. "reports" to export the heatmaps as files (headless) instead of showing them
+cache_dir = None  # e.g. ".vol-cache" to reuse RV/IV results of unchanged files across reruns
+screening_dir = None  # e.g. "screening-store" to keep each day's combined relative differences for historical screens
 
 # Initialize DataHandler and Visualizer
+# To serve bars from one memory-mapped file, build it with
+# DataHandler().build_bar_store("daily-bars", "daily-bars.arrow") and pass bar_store_path="daily-bars.arrow".
+# The store is a snapshot: rebuild it after each daily-bars update (report_cache_stats warns about changed files)
 data_handler = DataHandler()
-visualizer = Visualizer()
+visualizer = Visualizer(output_dir=report_dir, formats=('png', 'svg'), n_workers=n_workers)
 
 # Load tickers
 tickers = data_handler.load_tickers()
@@ -20,8 +36,23 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 daily_folder_path = os.path.join(current_dir, "daily-bars")
 options_data_folder_path = os.path.join(current_dir, "options-data")
 
+# One-time rewrite of the options store partitioned by trade date; point options_data_folder_path at it afterwards
+# data_handler.partition_options_store(options_data_folder_path, os.path.join(current_dir, "options-data-by-date"))
+
 # Initialize VolatilityCalculator
-vol_calculator = VolatilityCalculator(data_handler, visualizer)
+metrics = RunMetrics(JsonLinesSink(metrics_path) if metrics_path else None)
+result_cache = ResultCache(cache_dir) if cache_dir else None
+vol_calculator = VolatilityCalculator(data_handler, visualizer, n_workers=n_workers, metrics=metrics,
+                                      result_cache=result_cache)
+
+# Daily runs can instead roll persisted window sums forward over the newly appended bars:
+# close_close_df, gkyz_df = vol_calculator.process_incremental_vol(tickers, daily_folder_path, os.path.join(current_dir, "rv-state.pkl"))
+
+# Large universes can instead be streamed in fixed-size chunks with flat memory, writing long-format results to parquet:
+# from result_sinks import ParquetResultSink
+# with ParquetResultSink(os.path.join(current_dir, "relative-differences.parquet")) as sink:
+#     for chunk in vol_calculator.stream_relative_differences(tickers, daily_folder_path, options_data_folder_path, iv_date, sink=sink):
+#         pass
 
 # Process all tickers to calculate close-close realized volatility
 close_close_df = vol_calculator.process_close_close_vol(tickers, daily_folder_path)
@@ -31,50 +62,64 @@ print(close_close_df)
 gkyz_df = vol_calculator.process_gkyz_vol(tickers, daily_folder_path)
 print(gkyz_df)
 
+# Parkinson, Rogers-Satchell and Yang-Zhang realized volatility, sharing each ticker's bars and log price ratios
+estimator_dfs = vol_calculator.process_estimator_vols(tickers, daily_folder_path)
+for estimator, estimator_df in estimator_dfs.items():
+    print(estimator)
+    print(estimator_df)
+
+# All estimators share the bar store, so each file should be a miss exactly once
+data_handler.report_cache_stats()
+
 # # Trim DataFrames
 # gkyz_df_filtered = gkyz_df.iloc[5:-1]
 # close_close_df_filtered = close_close_df.iloc[5:-1]
 
-# Process all tickers to calculate implied volatility for a given date
-implied_vol = vol_calculator.process_implied_vol(tickers, options_data_folder_path, iv_date)
+# Historical IV vs RV for every options trade date, e.g. for backtesting the relative difference signal:
+# backfill = vol_calculator.backfill_iv_rv(tickers, daily_folder_path, options_data_folder_path, output_path=os.path.join(current_dir, "iv-rv-backfill.parquet"))
 
-# Calculate relative differences
-relative_diff_gkyz_df, relative_diff_close_close_df = vol_calculator.calculate_relative_differences(
-    gkyz_df, close_close_df, implied_vol
-)
+# Process all tickers to interpolate implied volatility to each RV horizon for a given date
+# (horizons beyond a ticker's longest expiry are NaN unless extrapolate=True; process_implied_vol gives the flat average across expiries instead)
+implied_vol = vol_calculator.process_implied_vol_term_structure(tickers, options_data_folder_path, iv_date)
+# To snapshot chains from Interactive Brokers into a partitioned store and start IV on each ticker as its chain lands:
+# from options_ingest import IBOptionsSource, OptionsIngestor
+# ingestor = OptionsIngestor(IBOptionsSource(), os.path.join(current_dir, "options-data-by-date"), data_handler, rate_limit=40)
+# implied_vol = vol_calculator.ingest_implied_vol_term_structure(ingestor, tickers, iv_date)
 
-# Combine the two relative difference DataFrames using a weighted average
+# Weighted relative differences, threshold counts and top N stocks, computed in one pass over float32 panels
 weight_gkyz = 0.6
 weight_close_close = 0.4
-combined_relative_diff = (weight_gkyz * relative_diff_gkyz_df) + (weight_close_close * relative_diff_close_close_df)
-
-# Set thresholds for filtering large relative differences
 threshold_plus = 0.75  # For large positive differences
 threshold_neg = -0.5   # For large negative differences
-
-# Create masks for values exceeding the thresholds
-mask_positive = combined_relative_diff >= threshold_plus
-mask_negative = combined_relative_diff <= threshold_neg
-
-# --- Count occurrences above the threshold for each stock ---
-
-# For positive differences, count how many times each stock exceeds the threshold
-positive_counts = mask_positive.sum(axis=0)  # Sum along the time horizon axis for each stock
-
-# For negative differences, count how many times each stock is below the negative threshold
-negative_counts = mask_negative.sum(axis=0)  # Sum along the time horizon axis for each stock
-
-# --- Select top N stocks with the most occurrences above/below the threshold ---
-
 top_n = 20
 
-# Select the top stocks with the most positive occurrences
-top_positive_stocks = positive_counts.sort_values(ascending=False).head(top_n).index
-
-# Select the top stocks with the most negative occurrences
-top_negative_stocks = negative_counts.sort_values(ascending=False).head(top_n).index
+screen = vol_calculator.screen_relative_differences(
+    gkyz_df, close_close_df, implied_vol, weight_gkyz=weight_gkyz, weight_close_close=weight_close_close,
+    threshold_plus=threshold_plus, threshold_neg=threshold_neg, top_n=top_n
+)
+combined_relative_diff = screen.combined
+
+# How many time horizons each stock is above/below the thresholds, and the top stocks by those counts
+positive_counts = screen.positive_counts
+negative_counts = screen.negative_counts
+top_positive_stocks = screen.top_positive_stocks
+top_negative_stocks = screen.top_negative_stocks
+print(pd.DataFrame({'positive_count': positive_counts[top_positive_stocks]}))
+print(pd.DataFrame({'negative_count': negative_counts[top_negative_stocks]}))
+
+# Keep today's panel, so screens over past days need no rerun of the pipeline
+if screening_dir:
+    screening_store = ScreeningStore(os.path.join(current_dir, screening_dir))
+    screening_store.append(iv_date, combined_relative_diff, overwrite=True)
+    print(screening_store.top_per_horizon(last_n_days=20, top_n=top_n, rich=True))
+    print(screening_store.top_per_horizon(last_n_days=20, top_n=top_n, rich=False))
+    print(screening_store.streaks(threshold_plus, min_days=5))
 
 # Visualize the relative differences with count overlays
 visualizer.visualize_top_relative_differences(combined_relative_diff)
 
+# Report tickers that failed in any stage
+vol_calculator.report_errors()
+metrics.close()
+
 print("done")
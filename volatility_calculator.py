@@ -1,240 +1,509 @@
 from data_handler import DataHandler
 from visualizer import Visualizer
+from volatility_engine import VolatilityEngine
+from incremental_state import IncrementalStateStore, update_state
+from file_utils import file_fingerprint
+from parallel import process_pool
+from instrumentation import RunMetrics
+from panels import PANEL_DTYPE, relative_differences, screen_relative_differences, to_panel
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import itertools
+import logging
+import time
 import pandas as pd
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+
+def _timed_call(function, *args):
+    """Call function and return its result with the elapsed wall time (module level so workers can run it)."""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
 class VolatilityCalculator:
-    def __init__(self, data_handler, visualizer):
+    def __init__(self, data_handler, visualizer, n_workers=1, metrics=None, result_cache=None):
         self.data_handler = data_handler
         self.visualizer = visualizer
-        self.final_close_close_rv = {}
-        self.final_gkyz_rv = {}
-        self.final_iv = {}
-
-    def calculate_realized_volatility(self, df, stock_symbol, start_date, end_date, F=1):
-        """Calculate the close-to-close realized volatility for a specified date range."""
-        # Ensure the index is a DatetimeIndex for date filtering
-        df.index = pd.to_datetime(df.index)
-        
-        # Filter data for the specified stock and date range
-        data = df[(df['Symbol'] == stock_symbol) & (df.index >= start_date) & (df.index <= end_date)].copy()
-        
-        # Calculate log returns
-        data['Log Returns'] = np.log(data['Close'] / data['Close'].shift(1))
-        data = data.apply(pd.to_numeric, errors='coerce')
-        
-        # Drop the first NA value created by the shift operation
-        data = data.dropna(subset=['Log Returns'])
-        
-        # Calculate the number of observations
-        N = len(data['Log Returns'])
-        
-        if N < 2:
-            return np.nan  # Not enough data to calculate volatility
-        
-        # Calculate the sum of squared log returns
-        squared_data = data['Log Returns'] ** 2
-        sum_squared_log_returns = squared_data.sum(axis=0)
-        
-        # Calculate the sample variance and adjust for population variance
-        sample_variance = np.sqrt((sum_squared_log_returns) / N)
-        population_variance = sample_variance * (N / (N - 1))
+        self.engine = VolatilityEngine()
+        self.n_workers = n_workers
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.result_cache = result_cache
+        self.errors = []  # (stage, ticker, message) of the failures since the last report_errors
+
+    def _record_error(self, stage_metrics, ticker, error, load_time=0.0):
+        """Collect a per-ticker failure instead of aborting the run."""
+        message = f"{type(error).__name__}: {error}"
+        self.errors.append((stage_metrics.name, ticker, message))
+        stage_metrics.record_ticker(ticker, load_time=load_time, error=message)
+        logger.debug("%s - %s failed: %s", ticker, stage_metrics.name, message)
+
+    def _timed_load(self, load, ticker):
+        """Run load(ticker) and return its result with the load time and the rows/bytes it read."""
+        self.data_handler.reset_thread_io()
+        args, load_time = _timed_call(load, ticker)
+        rows, bytes_read = self.data_handler.thread_io()
+        return args, load_time, rows, bytes_read
+
+    def _map_tickers(self, tickers, stage, load, compute):
+        """Load and compute each ticker, serially or across worker pools, returning results in ticker order.
+
+        load(ticker) runs in a reader thread and returns the arguments of compute, which runs in a
+        worker process when n_workers > 1. Both must raise to report a failed ticker. Per-ticker
+        timings, rows, bytes read and failures are recorded under the stage in self.metrics.
+        """
+        results = {}
+        with self.metrics.stage(stage) as stage_metrics:
+            if self.n_workers <= 1:
+                for ticker in tickers:
+                    logger.debug("Processing %s - %s", ticker, stage)
+                    try:
+                        args, load_time, rows, bytes_read = self._timed_load(load, ticker)
+                    except Exception as e:
+                        self._record_error(stage_metrics, ticker, e)
+                        continue
+                    try:
+                        results[ticker], compute_time = _timed_call(compute, *args)
+                    except Exception as e:
+                        self._record_error(stage_metrics, ticker, e, load_time)
+                        continue
+                    stage_metrics.record_ticker(ticker, load_time, compute_time, rows, bytes_read)
+                return results
+
+            with process_pool(self.n_workers) as cpu_pool:
+                # Start the worker processes before any reader thread exists, so no lock is held while forking
+                cpu_pool.submit(int).result()
+
+                # Keep at most max_in_flight loads and as many computations pending, so only a bounded
+                # number of tickers' inputs are in memory at once
+                max_in_flight = 2 * self.n_workers
+                pending_tickers = iter(tickers)
+                loads = deque()
+                computations = deque()
+
+                def finish_computation():
+                    ticker, computation, load_time, rows, bytes_read = computations.popleft()
+                    try:
+                        results[ticker], compute_time = computation.result()
+                    except Exception as e:
+                        self._record_error(stage_metrics, ticker, e, load_time)
+                        return
+                    stage_metrics.record_ticker(ticker, load_time, compute_time, rows, bytes_read)
+
+                with ThreadPoolExecutor(max_workers=self.n_workers) as io_pool:
+                    for ticker in itertools.islice(pending_tickers, max_in_flight):
+                        loads.append((ticker, io_pool.submit(self._timed_load, load, ticker)))
+                    while loads:
+                        ticker, loading = loads.popleft()
+                        try:
+                            args, load_time, rows, bytes_read = loading.result()
+                        except Exception as e:
+                            self._record_error(stage_metrics, ticker, e)
+                            args = None
+                        del loading
+                        for next_ticker in itertools.islice(pending_tickers, 1):
+                            loads.append((next_ticker, io_pool.submit(self._timed_load, load, next_ticker)))
+                        if args is None:
+                            continue
+
+                        computations.append((ticker, cpu_pool.submit(_timed_call, compute, *args),
+                                             load_time, rows, bytes_read))
+                        del args
+                        while len(computations) > max_in_flight:
+                            finish_computation()
+
+                while computations:
+                    finish_computation()
+        return results
+
+    def _map_cached(self, tickers, stage, params, input_paths, load, compute):
+        """_map_tickers, reusing the cached result of every ticker whose input files are unchanged.
+
+        input_paths(ticker) lists the files a ticker's result is computed from; their fingerprints and
+        the stage params key the cache. Failed tickers are not cached, so they are retried next run.
+        """
+        if self.result_cache is None:
+            return self._map_tickers(tickers, stage, load, compute)
+
+        cache = self.result_cache
+        entries = cache.load_stage(stage, params)
+        fingerprints = {ticker: tuple(cache.fingerprint(path) for path in input_paths(ticker)) for ticker in tickers}
+        stale = [ticker for ticker in tickers
+                 if ticker not in entries or entries[ticker][0] != fingerprints[ticker]]
+        cache.hits += len(tickers) - len(stale)
+        cache.misses += len(stale)
+        logger.info("%s: %d tickers cached, %d to compute", stage, len(tickers) - len(stale), len(stale))
+
+        computed = self._map_tickers(stale, stage, load, compute)
+        if computed:
+            entries.update((ticker, (fingerprints[ticker], result)) for ticker, result in computed.items())
+            cache.save_stage(stage, params, entries)
+
+        results = {}
+        for ticker in tickers:
+            if ticker in computed:
+                results[ticker] = computed[ticker]
+            elif ticker not in stale:
+                results[ticker] = entries[ticker][1]
+        return results
+
+    def report_errors(self):
+        """Log the per-ticker failures collected during the run and return them, starting a new run's collection."""
+        errors, self.errors = self.errors, []
+        if not errors:
+            return errors
+        logger.warning("%d ticker failures:", len(errors))
+        for stage, ticker, message in errors:
+            logger.warning("  %s - %s: %s", ticker, stage, message)
+        return errors
 
-        # Calculate the realized volatility
-        realized_volatility = population_variance * np.sqrt(252)
-        
-        return realized_volatility
-    
     def get_close_close_vol(self, df, stock_symbol):
         """Calculate the close-close realized volatility for a given ticker."""
-        end_date = df.index[-1]  # Last available date in the DataFrame
-        date_ranges = {
-            # "5 year": end_date - pd.offsets.BDay(5*252),
-            "1 year": end_date - pd.offsets.BDay(252),  # Approximate number of business days in a year
-            "9 month": end_date - pd.offsets.BDay(189),  # Approximate number of business days in 9 months
-            "6 month": end_date - pd.offsets.BDay(126),  # Approximate number of business days in 6 months
-            "3 month": end_date - pd.offsets.BDay(63),  # Approximate number of business days in 3 months
-            "1 month": end_date - pd.offsets.BDay(21),  # Approximate number of business days in a month
-            "2 week": end_date - pd.offsets.BDay(10),
-            "1 week": end_date - pd.offsets.BDay(5),  # Approximate number of business days in a week
-            # "2 day": end_date - pd.offsets.BDay(2),
-        }
-        
-        close_close_rv = {}
-        for period, start_date in date_ranges.items():
-            if start_date < df.index[0]:  # Ensure the start date is within the available data range
-                close_close_rv[period] = None
-            else:
-                close_close_rv[period] = self.calculate_realized_volatility(df, stock_symbol, start_date, end_date)
-            
-        return close_close_rv
+        bars = self.engine.to_bars(df, stock_symbol)
+        return self.engine.close_close_vol(bars, first_date=df.index[0], last_date=df.index[-1])
     
+    def _load_bars(self, daily_folder_path, ticker):
+        """Load the bars of a ticker and return them with the first and last dates of its file."""
+        loaded = self.data_handler.load_bar_arrays(daily_folder_path, ticker)
+        if loaded is None:
+            raise FileNotFoundError(f"No daily bars for {ticker} in {daily_folder_path}")
+        return loaded
+
     def process_close_close_vol(self, tickers, daily_folder_path):
         """Loop through each ticker to calculate close-close realized volatility."""
-        for ticker in tickers:
-            print(f"Processing {ticker} - Close Close RV")
-            df = self.data_handler.load_parquet_file(daily_folder_path, ticker)
-            if df is not None:
-                results = self.get_close_close_vol(df, ticker)
-                self.final_close_close_rv[ticker] = results
-
-        # Convert final dictionary to DataFrame
-        close_close_df = pd.DataFrame.from_dict(self.final_close_close_rv, orient='index').T
+        results = self._map_cached(
+            tickers, "Close Close RV", {'horizons': self.engine.horizons},
+            lambda ticker: [self.data_handler.bar_input_path(daily_folder_path, ticker)],
+            lambda ticker: self._load_bars(daily_folder_path, ticker),
+            self.engine.close_close_vol,
+        )
+
+        # Convert the results of this call to a time horizons x stocks panel
+        close_close_df = to_panel(results, list(self.engine.horizons))
         return close_close_df
 
-    def calculate_rolling_gkyz_volatility(self, df, stock_symbol, window, F=252, start_date=None, end_date=None):
-        """Calculate rolling GKYZ realized volatility for a given stock and window size."""
-        # Ensure the index is a DatetimeIndex for date filtering
-        df.index = pd.to_datetime(df.index)
-
-        # Filter data for the specified stock
-        data = df[df['Symbol'] == stock_symbol].copy()
-
-        # Apply date filtering if start_date and end_date are provided
-        if start_date is not None:
-            data = data[data.index >= pd.to_datetime(start_date)]
-        if end_date is not None:
-            data = data[data.index <= pd.to_datetime(end_date)]
-
-        # Ensure we have all necessary columns
-        if not {'Open', 'High', 'Low', 'Close'}.issubset(data.columns):
-            raise ValueError("Missing required data columns.")
-
-        # Logarithmic returns
-        data['log_oc_prev'] = np.log(data['Open'] / data['Close'].shift(1))
-        data['log_hl'] = np.log(data['High'] / data['Low'])
-        data['log_co'] = np.log(data['Close'] / data['Open'])
-
-        # Calculation of GKYZ components
-        data['term1'] = data['log_oc_prev'] ** 2
-        data['term2'] = 0.5 * (data['log_hl'] ** 2)
-        data['term3'] = (2 * np.log(2) - 1) * (data['log_co'] ** 2)
-
-        # Rolling window calculation of variance
-        data['variance'] = data['term1'] + data['term2'] - data['term3']
-        rolling_variance = data['variance'].rolling(window=window).sum()
-
-        # Calculate rolling GKYZ realized volatility
-        gkyz_scaling_factor = np.sqrt(F * 252 / window)
-        data['rolling_gkyz_volatility'] = gkyz_scaling_factor * np.sqrt(rolling_variance)
-
-        # Return the data with Close and rolling_gkyz_volatility columns
-        return data[['Close', 'rolling_gkyz_volatility']]
-
     def get_gkyz_vol(self, df, stock_symbol):
         """Get rolling GKYZ realized volatility for different date ranges."""
-        date_ranges = {
-            # "5 year": 5 * 252,
-            "1 year": 252,  # Approximate number of business days in a year
-            "9 month": 189,  # Approximate number of business days in 9 months
-            "6 month": 126,  # Approximate number of business days in 6 months
-            "3 month": 63,  # Approximate number of business days in 3 months
-            "1 month": 21,  # Approximate number of business days in a month
-            "2 week": 10,
-            "1 week": 5,  # Approximate number of business days in a week
-            # "2 day": 2,
-        }
-
-        gkyz_rv = {}
-        F = 1
-
-        for period, window_size in date_ranges.items():
-            volatility_data = self.calculate_rolling_gkyz_volatility(df, stock_symbol, window_size, F)
-            if not volatility_data.empty:
-                last_valid_volatility = (
-                    volatility_data['rolling_gkyz_volatility']
-                    .dropna()
-                    .iloc[-1]
-                    if not volatility_data['rolling_gkyz_volatility'].dropna().empty
-                    else np.nan
-                )
-                gkyz_rv[period] = last_valid_volatility
-            else:
-                gkyz_rv[period] = np.nan
-
-        return gkyz_rv
+        bars = self.engine.to_bars(df, stock_symbol)
+        return self.engine.gkyz_vol(bars, F=1)
 
     def process_gkyz_vol(self, tickers, daily_folder_path):
         """Loop through each ticker to calculate GKYZ realized volatility."""
-        for ticker in tickers:
-            print(f"Processing {ticker} - GKYZ RV")
-            df = self.data_handler.load_parquet_file(daily_folder_path, ticker)
-            if df is not None:
-                results = self.get_gkyz_vol(df, ticker)
-                self.final_gkyz_rv[ticker] = results
-
-        # Convert final dictionary to DataFrame
-        gkyz_df = pd.DataFrame.from_dict(self.final_gkyz_rv, orient='index').T
+        results = self._map_cached(
+            tickers, "GKYZ RV", {'horizons': self.engine.horizons, 'F': 1},
+            lambda ticker: [self.data_handler.bar_input_path(daily_folder_path, ticker)],
+            lambda ticker: self._load_bars(daily_folder_path, ticker)[:1],
+            self.engine.gkyz_vol,
+        )
+
+        # Convert the results of this call to a time horizons x stocks panel
+        gkyz_df = to_panel(results, list(self.engine.horizons))
         return gkyz_df
     
-    def process_implied_vol(self, tickers, options_data_folder_path, iv_date):
-        """Loop through each ticker to calculate implied volatility for a given date."""
-        for ticker in tickers:
-            print(f"Processing {ticker} - Implied Volatility")
-
-            # Load options data parquet file
-            options_file_path = f"{options_data_folder_path}/{ticker}.parquet"
-            try:
-                df = pd.read_parquet(options_file_path)
-            except FileNotFoundError:
-                print(f"Options data file for {ticker} not found: {options_file_path}")
-                continue
-            except Exception as e:
-                print(f"Error loading options data for {ticker}: {e}")
-                continue
-
-            # Filter the data to only keep data on the specific date (iv_date)
-            df['time'] = pd.to_datetime(df['time'])
-            filtered_df = df[df['time'].dt.date == pd.to_datetime(iv_date).date()].copy()
-
-            if filtered_df.empty:
-                print(f"No data available for {ticker} on {iv_date}")
-                continue
+    def process_estimator_vols(self, tickers, daily_folder_path, estimators=('parkinson', 'rogers_satchell', 'yang_zhang')):
+        """Loop through each ticker to calculate realized volatility with several range-based estimators at once.
+
+        Each ticker's bars are loaded once and shared by every estimator in volatility_engine.ESTIMATORS
+        named in estimators. Returns {estimator: time horizons x stocks panel}.
+        """
+        estimators = tuple(estimators)
+        results = self._map_cached(
+            tickers, "Range Estimator RV", {'horizons': self.engine.horizons, 'estimators': estimators},
+            lambda ticker: [self.data_handler.bar_input_path(daily_folder_path, ticker)],
+            lambda ticker: (self._load_bars(daily_folder_path, ticker)[0], estimators),
+            self.engine.estimator_vols,
+        )
+        horizons = list(self.engine.horizons)
+        return {name: to_panel({ticker: vols[name] for ticker, vols in results.items()}, horizons)
+                for name in estimators}
+
+    def _load_new_bars(self, state, daily_folder_path, ticker):
+        """Load a ticker's bars only if its file changed since the state was saved."""
+        # Fingerprint the file the bars are actually read from (the bar store when one is configured)
+        fingerprint = file_fingerprint(self.data_handler.bar_input_path(daily_folder_path, ticker))
+        if state is not None and state.fingerprint == fingerprint:
+            return state, None, None, fingerprint
+        bars, first_date, _ = self._load_bars(daily_folder_path, ticker)
+        return state, bars, first_date, fingerprint
+
+    def process_incremental_vol(self, tickers, daily_folder_path, state_path):
+        """Update close-close and GKYZ realized volatility from the bars added since the last run.
+
+        Rolling window sums are persisted per ticker in state_path; a ticker is recomputed from its
+        full history when it has no state yet or its file no longer starts with the saved history.
+        """
+        store = IncrementalStateStore(state_path, self.engine.horizons).load()
+        results = self._map_tickers(
+            tickers, "Incremental RV",
+            lambda ticker: self._load_new_bars(store.states.get(ticker), daily_folder_path, ticker),
+            update_state,
+        )
+        store.states.update(results)
+        store.save()
+
+        # Convert the results of this call to time horizons x stocks panels
+        horizons = list(self.engine.horizons)
+        close_close_df = to_panel({ticker: state.close_close_vol() for ticker, state in results.items()}, horizons)
+        gkyz_df = to_panel({ticker: state.gkyz_vol() for ticker, state in results.items()}, horizons)
+        return close_close_df, gkyz_df
+
+    @staticmethod
+    def get_implied_vol(filtered_df):
+        """Calculate the average model implied volatility across expiries from one day of option quotes."""
+        # Calculate average implied volatility by grouping by 'lastTradeDateOrContractMonth'
+        filtered_df = filtered_df.reset_index(drop=True)
+        grouped_df = filtered_df.groupby('lastTradeDateOrContractMonth').mean(numeric_only=True).reset_index()
+        maturity_iv = grouped_df[['lastTradeDateOrContractMonth', 'lastGreeks_iv', 'bidGreeks_iv', 'askGreeks_iv', 'modelGreeks_iv']]
+        
+        # Drop the first row to remove contracts without data
+        maturity_iv = maturity_iv.drop(0)
 
-            # Calculate average implied volatility by grouping by 'lastTradeDateOrContractMonth'
-            filtered_df = filtered_df.reset_index(drop=True)
-            grouped_df = filtered_df.groupby('lastTradeDateOrContractMonth').mean(numeric_only=True).reset_index()
-            maturity_iv = grouped_df[['lastTradeDateOrContractMonth', 'lastGreeks_iv', 'bidGreeks_iv', 'askGreeks_iv', 'modelGreeks_iv']]
-            
-            # Drop the first row to remove contracts without data
-            maturity_iv = maturity_iv.drop(0)
+        # Calculate the average model implied volatility
+        average_iv = maturity_iv.mean(numeric_only=True)
+        return average_iv.modelGreeks_iv
 
-            # Calculate the average model implied volatility
-            average_iv = maturity_iv.mean(numeric_only=True)
-            self.final_iv[ticker] = average_iv.modelGreeks_iv
+    def _load_options(self, options_data_folder_path, ticker, iv_date, columns=None):
+        """Load the option quotes of a ticker on iv_date, raising if there are none."""
+        # Load only the IV columns of the rows quoted on iv_date
+        filtered_df = self.data_handler.load_options_for_date(options_data_folder_path, ticker, iv_date, columns)
+        if filtered_df.empty:
+            raise ValueError(f"No data available for {ticker} on {iv_date}")
+        return (filtered_df,)
 
-        # Convert the final dictionary to a pandas Series
-        implied_vol = pd.Series(self.final_iv)
+    def process_implied_vol(self, tickers, options_data_folder_path, iv_date):
+        """Loop through each ticker to calculate implied volatility for a given date."""
+        results = self._map_cached(
+            tickers, "Implied Volatility", {'iv_date': str(iv_date)},
+            lambda ticker: [self.data_handler.options_input_path(options_data_folder_path, ticker, iv_date)[0]],
+            lambda ticker: self._load_options(options_data_folder_path, ticker, iv_date),
+            self.get_implied_vol,
+        )
+
+        # Convert the results of this call to a pandas Series
+        implied_vol = pd.Series(results, dtype=PANEL_DTYPE)
         return implied_vol
 
+    def _load_expiry_ivs(self, options_data_folder_path, ticker, iv_date, extrapolate=False):
+        """Load the expiry and model IV arrays of a ticker's quotes on iv_date."""
+        (filtered_df,) = self._load_options(options_data_folder_path, ticker, iv_date,
+                                            columns=['lastTradeDateOrContractMonth', 'modelGreeks_iv'])
+        return (filtered_df['lastTradeDateOrContractMonth'].to_numpy(dtype=str),
+                filtered_df['modelGreeks_iv'].to_numpy(dtype=np.float64), iv_date, extrapolate)
+
+    def process_implied_vol_term_structure(self, tickers, options_data_folder_path, iv_date, extrapolate=False):
+        """Loop through each ticker to interpolate its implied volatility term structure to the RV horizons.
+
+        Returns a DataFrame shaped like the RV tables (time horizons x stocks), so relative
+        differences compare matched tenors. Horizons beyond a ticker's longest expiry are NaN unless
+        extrapolate is set (see VolatilityEngine.implied_vol_term_structure).
+        """
+        results = self._map_cached(
+            tickers, "Implied Volatility Term Structure",
+            {'iv_date': str(iv_date), 'horizons': self.engine.horizons, 'extrapolate': extrapolate},
+            lambda ticker: [self.data_handler.options_input_path(options_data_folder_path, ticker, iv_date)[0]],
+            lambda ticker: self._load_expiry_ivs(options_data_folder_path, ticker, iv_date, extrapolate),
+            self.engine.implied_vol_term_structure,
+        )
+        return to_panel(results, list(self.engine.horizons))
+
+    def ingest_implied_vol_term_structure(self, ingestor, tickers, iv_date, extrapolate=False):
+        """Ingest option chains with an OptionsIngestor, interpolating each ticker's IV term structure as soon as its chain is stored.
+
+        Returns the same horizons x stocks DataFrame as process_implied_vol_term_structure.
+        """
+        def load_and_compute(ticker):
+            args, load_time, rows, bytes_read = self._timed_load(
+                lambda ticker: self._load_expiry_ivs(ingestor.store_path, ticker, iv_date, extrapolate), ticker)
+            result, compute_time = _timed_call(self.engine.implied_vol_term_structure, *args)
+            return result, load_time, compute_time, rows, bytes_read
+
+        async def ingest_and_compute(stage_metrics):
+            computations = []
+            async for ticker, error in ingestor.ingest(tickers, iv_date):
+                if error is not None:
+                    self._record_error(stage_metrics, ticker, error)
+                    continue
+                computations.append((ticker, asyncio.create_task(asyncio.to_thread(load_and_compute, ticker))))
+
+            results = {}
+            for ticker, computation in computations:
+                try:
+                    results[ticker], load_time, compute_time, rows, bytes_read = await computation
+                except Exception as e:
+                    self._record_error(stage_metrics, ticker, e)
+                    continue
+                stage_metrics.record_ticker(ticker, load_time, compute_time, rows, bytes_read)
+            return results
+
+        with self.metrics.stage("Options Ingest + Implied Volatility") as stage_metrics:
+            results = asyncio.run(ingest_and_compute(stage_metrics))
+        results = {ticker: results[ticker] for ticker in tickers if ticker in results}
+        return to_panel(results, list(self.engine.horizons))
+
+    @staticmethod
+    def get_implied_vol_history(engine, options_df, extrapolate=False):
+        """Interpolate the implied volatility term structure of every trade date, as process_implied_vol_term_structure does for one day.
+
+        Returns a DataFrame of time horizons x trade dates.
+        """
+        times = options_df['time']
+        if not pd.api.types.is_datetime64_any_dtype(times):
+            times = pd.to_datetime(times)
+        if times.dt.tz is not None:
+            times = times.dt.tz_localize(None)  # Trade dates in the timezone of the quotes
+
+        expiries = options_df['lastTradeDateOrContractMonth'].to_numpy(dtype=str)
+        implied_vols = options_df['modelGreeks_iv'].to_numpy(dtype=np.float64)
+        trade_dates = times.dt.normalize()
+        history = {
+            trade_date: engine.implied_vol_term_structure(expiries[rows], implied_vols[rows], trade_date, extrapolate)
+            for trade_date, rows in sorted(trade_dates.groupby(trade_dates).indices.items())
+        }
+        return pd.DataFrame(history, index=pd.Index(list(engine.horizons)), columns=pd.DatetimeIndex(list(history)),
+                            dtype=np.float64)
+
+    @staticmethod
+    def get_backfill_panel(engine, ticker, bars, first_date, options_df, same_day_close=False, extrapolate=False):
+        """Line up a ticker's daily implied volatility term structure with its rolling realized volatility for every horizon.
+
+        Each horizon's IV is interpolated to its tenor as in the live screen (see get_implied_vol_history).
+        Options are quoted during the session, before that day's close is known, so by default each IV
+        date is paired with the realized volatility as of the last bar strictly before it. Pass
+        same_day_close=True to also use the bar of the IV date itself, e.g. for end-of-day quotes.
+        """
+        implied_vol = VolatilityCalculator.get_implied_vol_history(engine, options_df, extrapolate)
+        close_close_series = engine.close_close_vol_series(bars, first_date)
+        gkyz_series = engine.gkyz_vol_series(bars, F=1)
+
+        # Realized volatility as of the last bar before (or, with same_day_close, on) each IV date
+        iv_dates = implied_vol.columns.to_numpy()
+        bar_positions = np.searchsorted(bars.dates, iv_dates, side='right' if same_day_close else 'left') - 1
+        has_bar = bar_positions >= 0
+        positions = np.where(has_bar, bar_positions, 0)
+        close_close_rv = np.where(has_bar, close_close_series[:, positions], np.nan)
+        gkyz_rv = np.where(has_bar, gkyz_series[:, positions], np.nan)
+
+        # Long layout: one row per (date, horizon), horizons in engine order within each date
+        n_horizons, n_dates = close_close_rv.shape
+        iv = implied_vol.to_numpy().ravel()
+        panel = pd.DataFrame({
+            'date': np.tile(iv_dates, n_horizons),
+            'ticker': ticker,
+            'horizon': np.repeat(list(engine.horizons), n_dates),
+            'implied_vol': iv,
+            'close_close_rv': close_close_rv.ravel(),
+            'gkyz_rv': gkyz_rv.ravel(),
+        })
+        panel['relative_diff_close_close'] = (iv - panel['close_close_rv']) / panel['close_close_rv']
+        panel['relative_diff_gkyz'] = (iv - panel['gkyz_rv']) / panel['gkyz_rv']
+        return panel.sort_values('date', kind='stable', ignore_index=True)
+
+    def _load_backfill_inputs(self, daily_folder_path, options_data_folder_path, ticker, start_date, end_date,
+                              same_day_close=False, extrapolate=False):
+        """Load the bars and the options IV history of a ticker."""
+        bars, first_date, _ = self._load_bars(daily_folder_path, ticker)
+        options_df = self.data_handler.load_options_history(
+            options_data_folder_path, ticker, columns=['time', 'lastTradeDateOrContractMonth', 'modelGreeks_iv'],
+            start_date=start_date, end_date=end_date,
+        )
+        return self.engine, ticker, bars, first_date, options_df, same_day_close, extrapolate
+
+    def backfill_iv_rv(self, tickers, daily_folder_path, options_data_folder_path, start_date=None, end_date=None,
+                       output_path=None, same_day_close=False, extrapolate=False):
+        """Build the historical implied vs realized volatility dataset over every options trade date.
+
+        Each options file is read once; the result has one row per (date, ticker, horizon) with the
+        implied volatility, both realized volatilities and their relative differences, and is written
+        to output_path as parquet when given. Realized volatility is as of the previous close unless
+        same_day_close is set (see get_backfill_panel), so the dataset has no lookahead. Implied
+        volatility is the term structure interpolated to each horizon, as in the live screen, with
+        horizons beyond the longest expiry NaN unless extrapolate is set.
+        """
+        results = self._map_tickers(
+            tickers, "IV/RV Backfill",
+            lambda ticker: self._load_backfill_inputs(daily_folder_path, options_data_folder_path, ticker,
+                                                      start_date, end_date, same_day_close, extrapolate),
+            self.get_backfill_panel,
+        )
+        if not results:
+            return pd.DataFrame()
+
+        backfill = pd.concat(results.values(), ignore_index=True)
+        backfill = backfill.sort_values('date', kind='stable', ignore_index=True)
+        backfill['ticker'] = backfill['ticker'].astype('category')
+        backfill['horizon'] = pd.Categorical(backfill['horizon'], categories=list(self.engine.horizons))
+        if output_path is not None:
+            backfill.to_parquet(output_path, index=False)
+        return backfill
+
     def calculate_relative_differences(self, gkyz_df_filtered, close_close_df_filtered, implied_vol):
         """Calculate relative differences between implied volatility and realized volatilities."""
+        with self.metrics.stage("Relative Differences") as stage_metrics:
+            stage_metrics.add_rows(gkyz_df_filtered.size)
+            return self._calculate_relative_differences(gkyz_df_filtered, close_close_df_filtered, implied_vol)
+
+    def stream_relative_differences(self, tickers, daily_folder_path, options_data_folder_path, iv_date,
+                                    chunk_size=256, sink=None):
+        """Stream tickers through RV -> IV -> relative differences in chunks of chunk_size, yielding one frame per chunk.
+
+        Each frame has one row per (ticker, horizon) with both realized volatilities, the
+        interpolated implied volatility and the relative differences, and is also written to sink
+        (e.g. a ParquetResultSink) when given. Only one chunk is held at a time, so keep the
+        DataHandler's bar_cache_size around chunk_size to bound memory on large universes.
+        """
+        horizons = list(self.engine.horizons)
+        for start in range(0, len(tickers), chunk_size):
+            chunk = tickers[start:start + chunk_size]
+            close_close_df = self.process_close_close_vol(chunk, daily_folder_path)
+            gkyz_df = self.process_gkyz_vol(chunk, daily_folder_path)
+            implied_vol = self.process_implied_vol_term_structure(chunk, options_data_folder_path, iv_date)
+
+            # Keep the tickers that made it through every stage, in chunk order
+            complete = [ticker for ticker in chunk if ticker in close_close_df.columns
+                        and ticker in gkyz_df.columns and ticker in implied_vol.columns]
+            close_close_df = close_close_df.reindex(index=horizons, columns=complete)
+            gkyz_df = gkyz_df.reindex(index=horizons, columns=complete)
+            implied_vol = implied_vol.reindex(index=horizons, columns=complete)
+            relative_diff_gkyz_df, relative_diff_close_close_df = self.calculate_relative_differences(
+                gkyz_df, close_close_df, implied_vol
+            )
+            if relative_diff_gkyz_df.empty:
+                continue
+
+            # Long layout: one row per (ticker, horizon), horizons in engine order within each ticker
+            frame = pd.DataFrame({
+                'ticker': np.repeat(complete, len(horizons)),
+                'horizon': np.tile(horizons, len(complete)),
+                'implied_vol': implied_vol.to_numpy().T.ravel(),
+                'close_close_rv': close_close_df.to_numpy().T.ravel(),
+                'gkyz_rv': gkyz_df.to_numpy().T.ravel(),
+                'relative_diff_close_close': relative_diff_close_close_df.to_numpy().T.ravel(),
+                'relative_diff_gkyz': relative_diff_gkyz_df.to_numpy().T.ravel(),
+            })
+            if sink is not None:
+                sink.write(frame)
+            yield frame
+
+    def _calculate_relative_differences(self, gkyz_df_filtered, close_close_df_filtered, implied_vol):
         # Check if the DataFrames are empty
         if gkyz_df_filtered.empty or close_close_df_filtered.empty:
-            print("One or both of the filtered DataFrames are empty. Skipping calculation.")
+            logger.warning("One or both of the filtered DataFrames are empty. Skipping calculation.")
             return pd.DataFrame(), pd.DataFrame()
 
-        # Convert gkyz_df and close_close_df from DataFrames to NumPy arrays for faster calculations
-        gkyz_array = gkyz_df_filtered.to_numpy()  # Shape: (number of tenors, number of stocks)
-        close_close_array = close_close_df_filtered.to_numpy()  # Same shape as above
-
-        # Align the implied_vol DataFrame to match the columns in gkyz_df and close_close_df
-        # Assume implied_vol is a pandas Series with the same index as gkyz_df columns
-        implied_vol_array = np.array(implied_vol)  # Shape: (number of stocks,)
-
-        # Expand implied_vol_array to match the shape of gkyz_array and close_close_array
-        implied_vol_expanded = np.tile(implied_vol_array, (gkyz_array.shape[0], 1))  # Broadcast IV across rows
-
-        # Calculate the relative difference for GKYZ and Close-Close Historical Volatility
-        try:
-            relative_diff_gkyz = (implied_vol_expanded - gkyz_array) / gkyz_array
-            relative_diff_close_close = (implied_vol_expanded - close_close_array) / close_close_array
-        except ValueError as e:
-            print(f"ValueError encountered during calculation: {e}")
-            return pd.DataFrame(), pd.DataFrame()
+        # Inputs are lined up by time horizon and stock, so missing IV or RV gives NaN rather than misaligned values
+        return relative_differences(gkyz_df_filtered, close_close_df_filtered, implied_vol)
 
-        # Convert the results back to DataFrames for better readability and further analysis
-        relative_diff_gkyz_df = pd.DataFrame(relative_diff_gkyz, index=gkyz_df_filtered.index, columns=gkyz_df_filtered.columns)
-        relative_diff_close_close_df = pd.DataFrame(relative_diff_close_close, index=close_close_df_filtered.index, columns=close_close_df_filtered.columns)
+    def screen_relative_differences(self, gkyz_df, close_close_df, implied_vol, weight_gkyz=0.6,
+                                    weight_close_close=0.4, threshold_plus=0.75, threshold_neg=-0.5, top_n=20):
+        """Combine the weighted relative differences, count threshold crossings and pick the top N stocks in one pass.
 
-        return relative_diff_gkyz_df, relative_diff_close_close_df
+        Returns a panels.ScreenResult.
+        """
+        with self.metrics.stage("Relative Difference Screen") as stage_metrics:
+            stage_metrics.add_rows(gkyz_df.size)
+            return screen_relative_differences(gkyz_df, close_close_df, implied_vol, weight_gkyz,
+                                               weight_close_close, threshold_plus, threshold_neg, top_n)
@@ -0,0 +1,373 @@
+from typing import NamedTuple
+import pandas as pd
+import numpy as np
+
+# Realized volatility horizons, in business days
+HORIZONS = {
+    # "5 year": 5 * 252,
+    "1 year": 252,  # Approximate number of business days in a year
+    "9 month": 189,  # Approximate number of business days in 9 months
+    "6 month": 126,  # Approximate number of business days in 6 months
+    "3 month": 63,  # Approximate number of business days in 3 months
+    "1 month": 21,  # Approximate number of business days in a month
+    "2 week": 10,
+    "1 week": 5,  # Approximate number of business days in a week
+    # "2 day": 2,
+}
+
+# Weight of the close-open term in the GKYZ variance
+GKYZ_CO_WEIGHT = 2 * np.log(2) - 1
+
+
+class LogPrices(NamedTuple):
+    """Per-bar log price ratios shared by the range-based estimators (NaN where the previous close is missing)."""
+    oc_prev: np.ndarray  # log(Open / previous Close), the overnight return
+    co: np.ndarray  # log(Close / Open)
+    hl: np.ndarray  # log(High / Low)
+    ho: np.ndarray  # log(High / Open)
+    lo: np.ndarray  # log(Low / Open)
+    hc: np.ndarray  # log(High / Close)
+    lc: np.ndarray  # log(Low / Close)
+
+
+# Range-based estimators by name: function(engine, log_prices) -> {horizon: annualized volatility}
+ESTIMATORS = {}
+
+
+def register_estimator(name):
+    """Register a range-based estimator computed from a ticker's LogPrices."""
+    def register(function):
+        ESTIMATORS[name] = function
+        return function
+    return register
+
+
+class Bars(NamedTuple):
+    """Daily OHLC bars of a single ticker as NumPy arrays, sorted by date."""
+    dates: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+
+
+class VolatilityEngine:
+    """Compute realized volatility for every horizon of a ticker from prefix sums over NumPy arrays."""
+
+    def __init__(self, horizons=None):
+        self.horizons = horizons if horizons else HORIZONS
+
+    @staticmethod
+    def to_bars(df, stock_symbol):
+        """Extract the OHLC arrays of the given stock from a daily bars DataFrame."""
+        if not {'Open', 'High', 'Low', 'Close'}.issubset(df.columns):
+            raise ValueError("Missing required data columns.")
+
+        if 'Symbol' in df.columns:
+            df = df[df['Symbol'] == stock_symbol]
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index(kind='stable')
+
+        return Bars(
+            dates=pd.to_datetime(df.index).to_numpy(),
+            open=df['Open'].to_numpy(dtype=np.float64),
+            high=df['High'].to_numpy(dtype=np.float64),
+            low=df['Low'].to_numpy(dtype=np.float64),
+            close=df['Close'].to_numpy(dtype=np.float64),
+        )
+
+    @staticmethod
+    def squared_log_return(close, prev_close):
+        """Squared close-close log return, for arrays or a single bar."""
+        return np.log(close / prev_close) ** 2
+
+    @staticmethod
+    def gkyz_term(log_oc_prev, log_hl, log_co):
+        """GKYZ variance term from the overnight, high-low and close-open log ratios, for arrays or a single bar."""
+        return log_oc_prev ** 2 + 0.5 * (log_hl ** 2) - GKYZ_CO_WEIGHT * (log_co ** 2)
+
+    @staticmethod
+    def bar_terms(prev_close, open_, high, low, close):
+        """Return the (squared log return, GKYZ variance term) of one bar, as the array versions compute them."""
+        return (VolatilityEngine.squared_log_return(close, prev_close),
+                VolatilityEngine.gkyz_term(np.log(open_ / prev_close), np.log(high / low), np.log(close / open_)))
+
+    @staticmethod
+    def squared_log_returns(bars):
+        """Return the squared close-close log returns of every bar (NaN for the first bar)."""
+        squared_returns = np.full(len(bars.close), np.nan)
+        squared_returns[1:] = VolatilityEngine.squared_log_return(bars.close[1:], bars.close[:-1])
+        return squared_returns
+
+    @staticmethod
+    def log_prices(bars):
+        """Compute the log price ratios of every bar once, for all range-based estimators."""
+        oc_prev = np.full(len(bars.close), np.nan)
+        oc_prev[1:] = np.log(bars.open[1:] / bars.close[:-1])
+        return LogPrices(
+            oc_prev=oc_prev,
+            co=np.log(bars.close / bars.open),
+            hl=np.log(bars.high / bars.low),
+            ho=np.log(bars.high / bars.open),
+            lo=np.log(bars.low / bars.open),
+            hc=np.log(bars.high / bars.close),
+            lc=np.log(bars.low / bars.close),
+        )
+
+    @staticmethod
+    def gkyz_variance(bars, log_prices=None):
+        """Return the GKYZ variance term of every bar (NaN for the first bar)."""
+        logs = log_prices if log_prices is not None else VolatilityEngine.log_prices(bars)
+        return VolatilityEngine.gkyz_term(logs.oc_prev, logs.hl, logs.co)
+
+    @staticmethod
+    def _prefix_sums(values):
+        """Return the prefix sums of values (NaN counted as zero) and the prefix counts of NaNs."""
+        missing = np.isnan(values)
+        sums = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, values))))
+        nan_counts = np.concatenate(([0], np.cumsum(missing)))
+        return sums, nan_counts
+
+    def close_close_vol(self, bars, first_date=None, last_date=None):
+        """Calculate the close-close realized volatility for every horizon ending on the last bar.
+
+        first_date and last_date default to the first and last bar; horizons reaching back before
+        first_date are reported as NaN, like horizons with too few returns.
+        """
+        n = len(bars.close)
+        if n == 0:
+            return {period: np.nan for period in self.horizons}
+        first_date = pd.Timestamp(bars.dates[0] if first_date is None else first_date)
+        last_date = pd.Timestamp(bars.dates[-1] if last_date is None else last_date)
+
+        # Squared log returns, computed once for the whole history
+        sums, nan_counts = self._prefix_sums(self.squared_log_returns(bars))
+
+        close_close_rv = {}
+        for period, days in self.horizons.items():
+            start_date = last_date - pd.offsets.BDay(days)
+            if start_date < first_date:  # Ensure the start date is within the available data range
+                close_close_rv[period] = np.nan
+                continue
+
+            # Returns inside the window exclude the first bar, whose previous close lies outside it
+            start = np.searchsorted(bars.dates, start_date.to_datetime64(), side='left') + 1
+            start = min(start, n)
+            N = (n - start) - (nan_counts[n] - nan_counts[start])
+            if N < 2:
+                close_close_rv[period] = np.nan  # Not enough data to calculate volatility
+                continue
+
+            # Sample variance adjusted for population variance
+            sample_variance = np.sqrt((sums[n] - sums[start]) / N)
+            population_variance = sample_variance * (N / (N - 1))
+            close_close_rv[period] = population_variance * np.sqrt(252)
+
+        return close_close_rv
+
+    def gkyz_vol(self, bars, F=1):
+        """Calculate the last valid rolling GKYZ realized volatility for every horizon."""
+        if len(bars.close) == 0:
+            return {period: np.nan for period in self.horizons}
+        # GKYZ variance terms, computed once for the whole history
+        return self._last_valid_rolling_vol(self.gkyz_variance(bars), F)
+
+    def _last_valid_rolling_vol(self, variances, F=1):
+        """Return the volatility of the last rolling window of every horizon without NaNs or a negative variance sum."""
+        n = len(variances)
+        gkyz_rv = {period: np.nan for period in self.horizons}
+        sums, nan_counts = self._prefix_sums(variances)
+
+        for period, window in self.horizons.items():
+            if window > n:
+                continue
+
+            # Rolling sums ending on each bar; windows containing NaNs are undefined
+            rolling_variance = sums[window:] - sums[:-window]
+            complete = (nan_counts[window:] - nan_counts[:-window]) == 0
+            valid = np.flatnonzero(complete & (rolling_variance >= 0))
+            if valid.size == 0:
+                continue
+
+            gkyz_scaling_factor = np.sqrt(F * 252 / window)
+            gkyz_rv[period] = gkyz_scaling_factor * np.sqrt(rolling_variance[valid[-1]])
+
+        return gkyz_rv
+
+    def _window_sums(self, values):
+        """Sum values over the last `window` bars of every horizon in one batched pass.
+
+        Returns (sums, windows), sums being NaN for horizons longer than the history or whose
+        window contains a NaN.
+        """
+        n = len(values)
+        windows = np.fromiter(self.horizons.values(), dtype=np.int64, count=len(self.horizons))
+        sums, nan_counts = self._prefix_sums(values)
+        starts = np.maximum(n - windows, 0)
+        complete = (windows <= n) & (nan_counts[n] - nan_counts[starts] == 0)
+        return np.where(complete, sums[n] - sums[starts], np.nan), windows
+
+    def estimator_vols(self, bars, estimators=None):
+        """Calculate the annualized volatility of every horizon with each registered estimator (all if None).
+
+        The log price ratios are computed once and shared, so each extra estimator only adds
+        arithmetic. Returns {estimator: {horizon: volatility}}; range-based estimators other than
+        GKYZ use the window ending on the last bar.
+        """
+        estimators = list(estimators) if estimators is not None else list(ESTIMATORS)
+        log_prices = self.log_prices(bars)
+        return {name: ESTIMATORS[name](self, log_prices) for name in estimators}
+
+    def close_close_vol_series(self, bars, first_date=None):
+        """Calculate the close-close realized volatility of every horizon as of every bar.
+
+        Returns an array of shape (number of horizons, number of bars); entry [h, e] equals
+        close_close_vol on the bars up to e, with horizons reaching back before first_date as NaN.
+        """
+        n = len(bars.close)
+        series = np.full((len(self.horizons), n), np.nan)
+        if n == 0:
+            return series
+        first_date = np.datetime64(pd.Timestamp(bars.dates[0] if first_date is None else first_date))
+
+        sums, nan_counts = self._prefix_sums(self.squared_log_returns(bars))
+        dates = pd.DatetimeIndex(bars.dates)
+        ends = np.arange(1, n + 1)
+
+        for h, days in enumerate(self.horizons.values()):
+            start_dates = (dates - pd.offsets.BDay(days)).to_numpy()
+            start = np.minimum(np.searchsorted(bars.dates, start_dates, side='left') + 1, ends)
+            N = (ends - start) - (nan_counts[ends] - nan_counts[start])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sample_variance = np.sqrt((sums[ends] - sums[start]) / N)
+                vol = sample_variance * (N / (N - 1)) * np.sqrt(252)
+            series[h] = np.where((N >= 2) & (start_dates >= first_date), vol, np.nan)
+
+        return series
+
+    def gkyz_vol_series(self, bars, F=1):
+        """Calculate the last valid rolling GKYZ realized volatility of every horizon as of every bar.
+
+        Returns an array of shape (number of horizons, number of bars); entry [h, e] equals
+        gkyz_vol on the bars up to e.
+        """
+        n = len(bars.close)
+        series = np.full((len(self.horizons), n), np.nan)
+        if n == 0:
+            return series
+
+        sums, nan_counts = self._prefix_sums(self.gkyz_variance(bars))
+
+        for h, window in enumerate(self.horizons.values()):
+            if window > n:
+                continue
+
+            rolling_variance = sums[window:] - sums[:-window]
+            complete = (nan_counts[window:] - nan_counts[:-window]) == 0
+            valid = complete & (rolling_variance >= 0)
+
+            # Carry the last valid window forward over incomplete ones
+            positions = np.where(valid, np.arange(valid.size), -1)
+            last_valid = np.maximum.accumulate(positions)
+            vol = np.sqrt(F * 252 / window) * np.sqrt(np.where(valid, rolling_variance, 0.0))
+            series[h, window - 1:] = np.where(last_valid >= 0, vol[last_valid], np.nan)
+
+        return series
+
+    def implied_vol_term_structure(self, expiries, implied_vols, iv_date, extrapolate=False):
+        """Interpolate one day of option implied volatilities to every horizon.
+
+        IVs are averaged per expiry, placed at their business days to expiry, and interpolated
+        linearly in total variance (IV^2 * T); horizons shorter than the nearest expiry take its IV.
+        Horizons beyond the longest expiry are NaN, as no quote covers that tenor, unless extrapolate
+        is set to give them the IV of the longest expiry. Every expiry with a valid date, a quoted IV
+        and at least one business day left is used, including the nearest one.
+        """
+        term_structure = {period: np.nan for period in self.horizons}
+        expiry_codes, expiry_index = np.unique(np.asarray(expiries, dtype=str), return_inverse=True)
+        implied_vols = np.asarray(implied_vols, dtype=np.float64)
+
+        # Mean IV per expiry in one pass, ignoring missing quotes
+        quoted = ~np.isnan(implied_vols)
+        counts = np.bincount(expiry_index[quoted], minlength=expiry_codes.size)
+        sums = np.bincount(expiry_index[quoted], weights=implied_vols[quoted], minlength=expiry_codes.size)
+        with np.errstate(invalid='ignore'):
+            expiry_iv = sums / counts
+
+        # Unparseable expiries, expiries without quotes and expired contracts are masked out below
+        expiry_dates = pd.to_datetime(pd.Series(expiry_codes), format='%Y%m%d', errors='coerce')
+        valid = expiry_dates.notna().to_numpy() & ~np.isnan(expiry_iv)
+        if not valid.any():
+            return term_structure
+        days = np.busday_count(
+            np.datetime64(pd.Timestamp(iv_date).date()),
+            expiry_dates[valid].to_numpy().astype('datetime64[D]'),
+        )
+        expiry_iv = expiry_iv[valid]
+        live = days > 0
+        if not live.any():
+            return term_structure
+        days, expiry_iv = days[live].astype(np.float64), expiry_iv[live]
+        order = np.argsort(days, kind='stable')
+        days, expiry_iv = days[order], expiry_iv[order]
+
+        horizons = np.array(list(self.horizons.values()), dtype=np.float64)
+        tenors = np.clip(horizons, days[0], days[-1])
+        total_variance = np.interp(tenors, days, expiry_iv ** 2 * days)
+        implied_vol = np.sqrt(total_variance / tenors)
+        if not extrapolate:
+            implied_vol[horizons > days[-1]] = np.nan
+        for period, iv in zip(self.horizons, implied_vol):
+            term_structure[period] = iv
+        return term_structure
+
+
+def rogers_satchell_variance(log_prices):
+    """Return the Rogers-Satchell variance term of every bar."""
+    return log_prices.hc * log_prices.ho + log_prices.lc * log_prices.lo
+
+
+def _annualized(engine, window_variance_sums, windows):
+    """Turn per-horizon sums of daily variance terms into annualized volatilities."""
+    with np.errstate(invalid='ignore'):
+        vols = np.sqrt(252 * window_variance_sums / windows)
+    return dict(zip(engine.horizons, vols.tolist()))
+
+
+@register_estimator('gkyz')
+def _gkyz_estimator(engine, log_prices):
+    """GKYZ variant of Garman-Klass with the overnight return, as VolatilityEngine.gkyz_vol."""
+    return engine._last_valid_rolling_vol(engine.gkyz_variance(None, log_prices))
+
+
+@register_estimator('parkinson')
+def _parkinson_estimator(engine, log_prices):
+    """Parkinson (1980): high-low range variance, log(H/L)^2 / (4 ln 2) per bar."""
+    sums, windows = engine._window_sums(log_prices.hl ** 2 / (4 * np.log(2)))
+    return _annualized(engine, sums, windows)
+
+
+@register_estimator('rogers_satchell')
+def _rogers_satchell_estimator(engine, log_prices):
+    """Rogers-Satchell (1991): drift-independent, log(H/C) log(H/O) + log(L/C) log(L/O) per bar."""
+    sums, windows = engine._window_sums(rogers_satchell_variance(log_prices))
+    return _annualized(engine, sums, windows)
+
+
+@register_estimator('yang_zhang')
+def _yang_zhang_estimator(engine, log_prices):
+    """Yang-Zhang (2000): overnight variance + k * open-close variance + (1 - k) * Rogers-Satchell variance."""
+    overnight_sums, windows = engine._window_sums(log_prices.oc_prev)
+    overnight_squares, _ = engine._window_sums(log_prices.oc_prev ** 2)
+    open_close_sums, _ = engine._window_sums(log_prices.co)
+    open_close_squares, _ = engine._window_sums(log_prices.co ** 2)
+    rogers_satchell_sums, _ = engine._window_sums(rogers_satchell_variance(log_prices))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overnight_variance = (overnight_squares - overnight_sums ** 2 / windows) / (windows - 1)
+        open_close_variance = (open_close_squares - open_close_sums ** 2 / windows) / (windows - 1)
+        k = 0.34 / (1.34 + (windows + 1) / (windows - 1))
+        variance = overnight_variance + k * open_close_variance + (1 - k) * rogers_satchell_sums / windows
+        vols = np.sqrt(252 * variance)
+    return dict(zip(engine.horizons, vols.tolist()))
+